@@ -46,7 +46,8 @@ def control_panel_view(request):
             ).count(),
             'error_spins_today': History.objects.filter(
                 timestamp__date=today,
-                success=False
+                success=False,
+                is_pending=False
             ).count(),
             'jackpot_cooldown_hours': settings.jackpot_cooldown // 3600,
         }
@@ -70,6 +71,7 @@ def control_panel_view(request):
         
         recent_errors = History.objects.filter(
             success=False,
+            is_pending=False,
             timestamp__gte=week_ago
         ).order_by('-timestamp')[:5]
     except Exception as e:
@@ -1,41 +1,34 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import JsonResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods, require_GET, require_POST
 from django.utils import timezone
-from django.db.models import Q
-from wheel.models import History, HistoryMark
+from django.utils.dateparse import parse_date
+from django.db.models import Exists, OuterRef
+from wheel.models import History, HistoryMark, DailyWheelStat
+from wheel.pagination import encode_cursor, decode_cursor, keyset_page, estimated_count
+from wheel.registry import get_wheels
+from wheel.search import search_history
 from api.jackpots_handler import cancel_jackpot
+from api.intra_ratelimit import intra_priority, PRIORITY_LOW
 from .admin_logging import logger as admin_logger
 from django.db import transaction
-import json
+from asgiref.sync import sync_to_async
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
+import csv, io, json, zlib
 
 
-@login_required
-@require_GET
-def history_admin_view(request):
-    """Main history administration view with pagination and filtering"""
-    if not request.user.has_perm('history_admin'):
-        return HttpResponseForbidden("Access denied")
-    
-    # Get filter parameters
-    search_query = request.GET.get('search', '').strip()
-    wheel_filter = request.GET.get('wheel', '')
-    status_filter = request.GET.get('status', '')  # 'cancelled', 'active', or ''
-    marked_filter = request.GET.get('marked', '')  # 'marked', 'unmarked', or ''
-    
-    # Base queryset
-    histories = History.objects.select_related('user', 'cancelled_by').prefetch_related('marks__marked_by')
-    
-    # Apply filters
+# Entries per page of the history administration view
+HISTORY_ADMIN_PAGE_SIZE = 50
+
+
+def _filter_histories(histories, search_query='', wheel_filter='', status_filter='', marked_filter='',
+                      search_payloads=False, ranked=False):
+    """History administration filters (page and export)"""
     if search_query:
-        histories = histories.filter(
-            Q(user__login__icontains=search_query) |
-            Q(details__icontains=search_query) |
-            Q(r_message__icontains=search_query)
-        )
+        histories = search_history(histories, search_query, payloads=search_payloads, ranked=ranked)
     
     if wheel_filter:
         histories = histories.filter(wheel=wheel_filter)
@@ -45,29 +38,79 @@ def history_admin_view(request):
     elif status_filter == 'success':
         histories = histories.filter(is_cancelled=False, success=True)
     elif status_filter == 'error':
-        histories = histories.filter(is_cancelled=False, success=False)
+        histories = histories.filter(is_cancelled=False, success=False, is_pending=False)
+    elif status_filter == 'pending':
+        histories = histories.filter(is_pending=True)
     
+    # EXISTS semi-joins: no join on the marks and no DISTINCT over the whole result
+    has_marks = Exists(HistoryMark.objects.filter(history=OuterRef('pk')))
     if marked_filter == 'marked':
-        histories = histories.filter(marks__isnull=False).distinct()
+        histories = histories.filter(has_marks)
     elif marked_filter == 'unmarked':
-        histories = histories.filter(marks__isnull=True)
+        histories = histories.filter(~has_marks)
+    return histories
+
+
+@login_required
+@require_GET
+def history_admin_view(request):
+    """Main history administration view with pagination and filtering.
+    Keyset pagination (?after= / ?before= cursors, see wheel/pagination.py): no COUNT(*) and no OFFSET
+    per page, the total shown is the planner's estimate. Search: see wheel/search.py."""
+    if not request.user.has_perm('history_admin'):
+        return HttpResponseForbidden("Access denied")
+    
+    # Get filter parameters
+    search_query = request.GET.get('search', '').strip()
+    wheel_filter = request.GET.get('wheel', '')
+    status_filter = request.GET.get('status', '')  # 'success', 'error', 'pending', 'cancelled' or ''
+    marked_filter = request.GET.get('marked', '')  # 'marked', 'unmarked', or ''
+    search_payloads = request.GET.get('payloads') == '1'  # also search reward messages / data (slow)
+    sort = 'relevance' if search_query and request.GET.get('sort') == 'relevance' else ''
     
-    # Pagination
-    paginator = Paginator(histories, 50)  # 50 entries per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    histories = _filter_histories(
+        History.objects.all(), search_query, wheel_filter, status_filter, marked_filter,
+        search_payloads=search_payloads, ranked=bool(sort),
+    )
     
-    # Get available wheels for filter dropdown
-    available_wheels = History.objects.values_list('wheel', flat=True).distinct().order_by('wheel')
+    # Pagination (best matches: the first page only)
+    page = histories.select_related('user', 'cancelled_by').prefetch_related('marks')
+    if sort == 'relevance':
+        entries = list(page.order_by('-rank', '-timestamp', '-id')[:HISTORY_ADMIN_PAGE_SIZE])
+        has_previous = has_next = False
+    else:
+        after = decode_cursor(request.GET.get('after', ''))
+        before = decode_cursor(request.GET.get('before', '')) if after is None else None
+        entries, has_previous, has_next = keyset_page(page, after=after, before=before, limit=HISTORY_ADMIN_PAGE_SIZE)
+    
+    # Filters, kept by the pagination links
+    filter_query = urlencode({k: v for k, v in (
+        ('search', search_query), ('payloads', '1' if search_payloads else ''), ('sort', sort),
+        ('wheel', wheel_filter), ('status', status_filter), ('marked', marked_filter),
+    ) if v})
+    
+    # Wheels of the filter dropdown: the configured ones (plus the filtered one, if removed since)
+    available_wheels = sorted(get_wheels())
+    if wheel_filter and wheel_filter not in available_wheels:
+        available_wheels.append(wheel_filter)
     
     context = {
-        'page_obj': page_obj,
+        'entries': entries,
+        'has_previous': has_previous,
+        'has_next': has_next,
+        'previous_cursor': encode_cursor(entries[0].timestamp, entries[0].id) if has_previous and entries else '',
+        'next_cursor': encode_cursor(entries[-1].timestamp, entries[-1].id) if has_next and entries else '',
+        'estimated_total': estimated_count(histories),
+        'filter_query': filter_query,
         'search_query': search_query,
+        'search_payloads': search_payloads,
+        'sort': sort,
         'wheel_filter': wheel_filter,
         'status_filter': status_filter,
         'marked_filter': marked_filter,
         'available_wheels': available_wheels,
         'user_can_cancel': request.user.has_perm('cancel_history_entry'),
+        'user_can_export': request.user.has_perm('history_export'),
     }
     
     return render(request, 'administration/history_admin.html', context)
@@ -149,7 +192,9 @@ def cancel_history_entry(request, history_id):
             if history.is_cancelled:
                 return JsonResponse({'error': 'History entry is already cancelled'}, status=400)
             
-            success, message, cancel_data = cancel_jackpot(request.user, history.function_name, history.r_data)
+            # Admin work: leaves the Intra quota reserve to live spins
+            with intra_priority(PRIORITY_LOW):
+                success, message, cancel_data = cancel_jackpot(request.user, history.function_name, history.r_data)
             
             if not success:
                 return JsonResponse({'error': f'Cancellation failed: {message} {cancel_data}'}, status=400)
@@ -160,6 +205,8 @@ def cancel_history_entry(request, history_id):
             history.cancelled_by = request.user
             history.cancellation_reason = reason
             history.save()
+            # Stats rollup: the spin stays counted, its reward leaves the distribution
+            DailyWheelStat.objects.record(history, cancelled=1)
             
             admin_logger.info(f"history_cancel success by={request.user.login} history_id={history_id} function={history.function_name} reason={reason} msg={message} data={cancel_data}")
             
@@ -205,6 +252,7 @@ def history_detail_api(request, history_id):
         'r_message': history.r_message,
         'r_data': history.r_data,
         'success': history.success,
+        'is_pending': history.is_pending,
         'is_cancelled': history.is_cancelled,
         'cancelled_at': history.cancelled_at.strftime('%Y-%m-%d %H:%M:%S') if history.cancelled_at else None,
         'cancelled_by': history.cancelled_by.login if history.cancelled_by else None,
@@ -214,4 +262,151 @@ def history_detail_api(request, history_id):
         'can_be_cancelled': history.can_be_cancelled()
     }
     
-    return JsonResponse(data)
\ No newline at end of file
+    return JsonResponse(data)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# History export (audits)
+#
+# Streamed as it is read: rows come from a server-side cursor, EXPORT_CHUNK_SIZE
+# at a time (QuerySet.aiterator), and are written out by ~EXPORT_BUFFER_SIZE
+# blocks, gzipped on the fly if asked. Memory stays constant whatever the
+# number of rows. Async view: under daphne, a sync iterator given to a
+# StreamingHttpResponse is read whole before being sent.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# (exported column, History field)
+EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('login', 'user__login'),
+    ('wheel', 'wheel'),
+    ('details', 'details'),
+    ('color', 'color'),
+    ('function', 'function_name'),
+    ('success', 'success'),
+    ('pending', 'is_pending'),
+    ('cancelled', 'is_cancelled'),
+    ('cancelled_at', 'cancelled_at'),
+    ('cancelled_by', 'cancelled_by__login'),
+    ('cancellation_reason', 'cancellation_reason'),
+    ('message', 'r_message'),
+    ('data', 'r_data'),
+)
+
+
+def _parse_day(value: str, name: str, end: bool = False):
+    """Start (end: end) of the local day value (YYYY-MM-DD), None if empty; ValueError if invalid."""
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValueError(f"'{name}' must be a date (YYYY-MM-DD)")
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1) if end else day, time.min))
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+async def _export_stream(rows, export_format: str, compress: bool, login: str):
+    columns = [column for column, _ in EXPORT_FIELDS]
+    encoder = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    out = io.StringIO()
+    writer = csv.writer(out) if export_format == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    def take() -> bytes:
+        data = out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+        return encoder.compress(data) if encoder else data
+
+    count = 0
+    try:
+        async for row in rows:
+            values = [row[field].isoformat() if isinstance(row[field], datetime) else row[field] for _, field in EXPORT_FIELDS]
+            if writer:
+                writer.writerow([_csv_value(value) for value in values])
+            else:
+                out.write(json.dumps(dict(zip(columns, values))))
+                out.write('\n')
+            count += 1
+            if out.tell() >= EXPORT_BUFFER_SIZE:
+                data = take()
+                if data:
+                    yield data
+        data = take()
+        if encoder:
+            data += encoder.flush()
+        if data:
+            yield data
+    except Exception as e:
+        admin_logger.error(f"history_export error by={login} rows={count} err={e}")
+        raise
+    admin_logger.info(f"history_export done by={login} rows={count}")
+
+
+@login_required
+@require_GET
+async def history_export(request):
+    """Stream the history entries matching the filters of the history administration view, plus
+    ?user=<login>&since=<YYYY-MM-DD>&until=<YYYY-MM-DD> (inclusive), oldest first (admin only).
+    ?format=ndjson|csv, ?gzip=1 for a gzipped file."""
+    user = await request.auser()
+    if not user.has_perm('history_export'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"'format' must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+    compress = request.GET.get('gzip') == '1'
+    try:
+        since = _parse_day(request.GET.get('since', ''), 'since')
+        until = _parse_day(request.GET.get('until', ''), 'until', end=True)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Filters: the search resolves logins (one query), hence the sync thread
+    histories = await sync_to_async(_filter_histories)(
+        History.objects.all(),
+        request.GET.get('search', '').strip(),
+        request.GET.get('wheel', ''),
+        request.GET.get('status', ''),
+        request.GET.get('marked', ''),
+        search_payloads=request.GET.get('payloads') == '1',
+    )
+    login = request.GET.get('user', '').strip().lower()
+    if login:
+        histories = histories.filter(user__login=login)
+    if since:
+        histories = histories.filter(timestamp__gte=since)
+    if until:
+        histories = histories.filter(timestamp__lt=until)
+
+    # values(): values_list() can't be iterated asynchronously (its iterable runs the query right away)
+    rows = histories.order_by('timestamp', 'id').values(*(field for _, field in EXPORT_FIELDS))
+    filters = {k: v for k, v in request.GET.items() if k not in ('format', 'gzip') and v}
+    admin_logger.info(f"history_export start by={user.login} format={export_format} gzip={compress} filters={filters}")
+
+    filename = f"history_{timezone.localtime():%Y%m%d-%H%M}.{export_format}" + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        _export_stream(rows.aiterator(chunk_size=EXPORT_CHUNK_SIZE), export_format, compress, user.login),
+        content_type='application/gzip' if compress else f"{EXPORT_FORMATS[export_format]}; charset=utf-8",
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,21 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from api.intra import intra_api
+from api.intra_metrics import collect
+
+
+@login_required
+@require_GET
+def intra_metrics_api(request):
+    """Intra API calls of every backend process: per route counts and latency, retries, quota (admin only)"""
+    if not request.user.has_perm('intra_metrics_api'):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+
+    # This process' latest numbers, then the snapshots of all the processes
+    try:
+        intra_api.flush_metrics()
+    except OSError:
+        pass
+    return JsonResponse({'success': True, 'metrics': collect()})
@@ -18,3 +18,13 @@ class SiteSettings(models.Model):
         default="Welcome on ft_wheel, have fun !",
         help_text="Message displayed in the announcement marquee on the homepage."
     )
+
+    # Bumped on every save, lets cached snapshots (administration.site_settings) tell old from new
+    generation = models.PositiveBigIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.generation += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'generation'}
+        super().save(*args, **kwargs)
@@ -0,0 +1,76 @@
+import threading, time
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import SiteSettings
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Site settings snapshot
+#
+# SiteSettings is read on every request (maintenance middleware, cooldown,
+# announcement). Each worker process keeps the row in memory and re-reads it
+# at most every CACHE_TTL seconds. Saving it invalidates the snapshot of the
+# saving worker at commit; the other workers pick the change up within
+# CACHE_TTL. The snapshot is shared: never modify it, write through the model.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Seconds a snapshot is served without reading the database
+CACHE_TTL = 5.0
+
+_lock = threading.Lock()
+_snapshot = None        # SiteSettings instance (unsaved defaults if the row does not exist)
+_fetched_at = float('-inf')
+# Generation of the last save committed by this process: an older snapshot
+# (read concurrently, before the commit) is never kept
+_min_generation = 0
+
+
+def _is_fresh() -> bool:
+    return (
+        _snapshot is not None
+        and _snapshot.generation >= _min_generation
+        and time.monotonic() - _fetched_at < CACHE_TTL
+    )
+
+
+def _fetch():
+    global _snapshot, _fetched_at
+    fetched_at = time.monotonic()
+    site_settings = SiteSettings.objects.filter(pk=1).first() or SiteSettings(pk=1)
+    with _lock:
+        # A concurrent reader may already hold a newer row
+        if _snapshot is None or site_settings.generation >= _snapshot.generation:
+            _snapshot = site_settings
+            _fetched_at = fetched_at
+        return _snapshot
+
+
+def get_site_settings() -> SiteSettings:
+    """Site settings, at most CACHE_TTL seconds old. Read-only."""
+    if _is_fresh():
+        return _snapshot
+    return _fetch()
+
+
+async def aget_site_settings() -> SiteSettings:
+    """Async get_site_settings(): only leaves the event loop when the snapshot is stale."""
+    if _is_fresh():
+        return _snapshot
+    return await sync_to_async(_fetch)()
+
+
+def invalidate(generation: int = 0):
+    """Drop the snapshot of this process; the next read goes to the database."""
+    global _fetched_at, _min_generation
+    with _lock:
+        _fetched_at = float('-inf')
+        _min_generation = max(_min_generation, generation)
+
+
+@receiver(post_save, sender=SiteSettings)
+def site_settings_saved(sender, instance, **kwargs):
+    generation = instance.generation
+    transaction.on_commit(lambda: invalidate(generation), using=kwargs.get('using'))
@@ -3,13 +3,13 @@ from django.http import JsonResponse, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth import get_user_model
-from django.conf import settings
 from django.core.paginator import Paginator
 from django.db.models import Q
 from django.db import transaction
 
 from .admin_logging import logger as admin_logger
-from wheel.models import Ticket
+from wheel.models import Ticket, TicketBalance
+from wheel.registry import get_wheels
 
 User = get_user_model()
 
@@ -38,10 +38,10 @@ def grant_ticket_api(request):
         return JsonResponse({'success': False, 'error': 'Missing login or wheel'}, status=400)
 
     # Validate wheel exists
-    wheels = getattr(settings, 'WHEEL_CONFIGS', {})
+    wheels = get_wheels()
     if wheel_slug not in wheels:
         return JsonResponse({'success': False, 'error': 'Unknown wheel slug'}, status=400)
-    if not wheels[wheel_slug].get('ticket_only', False):
+    if not wheels[wheel_slug].ticket_only:
         return JsonResponse({'success': False, 'error': 'Wheel is not ticket-only'}, status=400)
 
     try:
@@ -62,11 +62,11 @@ def tickets_summary_api(request):
         return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
 
     # Return counts per wheel (unused only) and last 20 granted
-    from django.db.models import Count
+    from django.db.models import Sum
     unused = (
-        Ticket.objects.filter(used_at__isnull=True)
+        TicketBalance.objects.filter(unused_count__gt=0)
         .values('wheel_slug')
-        .annotate(count=Count('id'))
+        .annotate(count=Sum('unused_count'))
         .order_by('wheel_slug')
     )
     recent = (
@@ -5,6 +5,7 @@ from . import wheels_views
 from . import history_views
 from . import control_panel_views
 from . import tickets_views
+from . import metrics_views
 
 urlpatterns = [
     # Control panel (admin and moderator access)
@@ -30,4 +31,9 @@ urlpatterns = [
     path('adm/history/<int:history_id>/details/', history_views.history_detail_api, name='history_detail_api'),
     path('adm/history/<int:history_id>/mark/', history_views.add_history_mark, name='add_history_mark'),
     path('adm/history/<int:history_id>/cancel/', history_views.cancel_history_entry, name='cancel_history_entry'),
+    # History export (admin only)
+    path('adm/history/export/', history_views.history_export, name='history_export'),
+
+    # Intra API metrics (admin only)
+    path('adm/metrics/intra/', metrics_views.intra_metrics_api, name='intra_metrics_api'),
 ]
\ No newline at end of file
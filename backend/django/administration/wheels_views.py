@@ -5,9 +5,10 @@ from django.views.decorators.csrf import csrf_protect
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponse
 from django.conf import settings
 from django.views.decorators.http import require_GET, require_POST
-import os, json
+import os, json, itertools
 
-from ft_wheel.utils import load_wheels, build_wheel_versions
+from ft_wheel.utils import compile_wheel
+from wheel.registry import wheel_registry, get_wheels
 from .admin_logging import logger as admin_logger
 from wheel.models import Ticket
 
@@ -16,11 +17,16 @@ def _get_wheel_file_path(config):
     """Helper to get file path for a wheel config"""
     return os.path.join(settings.WHEEL_CONFIGS_DIR, f'jackpots_{config}.json')
 
+def _write_wheel_file(path, data):
+    """Helper to write a config file atomically (other workers never read a half-written file)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
 def _reload_wheels_and_versions():
-    """Helper to reload configs and rebuild version IDs"""
-    settings.WHEEL_CONFIGS = load_wheels(settings.WHEEL_CONFIGS_DIR)
-    settings.WHEEL_VERSION_IDS = build_wheel_versions(settings.WHEEL_CONFIGS)
-    return settings.WHEEL_VERSION_IDS
+    """Helper to reload changed configs now in this worker (others pick them up from the registry)"""
+    return wheel_registry.refresh().versions
 
 def _normalize_wheel_name(name):
     """Helper to normalize wheel names"""
@@ -35,14 +41,13 @@ def admin_wheels(request):
         return HttpResponseForbidden("Access denied")
 
     data = {}
-    for slug, meta in settings.WHEEL_CONFIGS.items():
-        sectors = meta.get('sectors', [])
+    for slug, wheel in get_wheels().items():
         data[slug] = {
-            'count': len(sectors),
-            'sample': sectors[:5],
-            'title': meta.get('title'),
-            'url': meta.get('url', slug),
-            'ticket_only': bool(meta.get('ticket_only', False)),
+            'count': wheel.total_weight,
+            'sample': [sector.as_dict() for sector in itertools.islice(wheel.expanded_sectors(), 5)],
+            'title': wheel.title,
+            'url': wheel.url,
+            'ticket_only': wheel.ticket_only,
         }
     
     if request.headers.get('Accept', '').startswith('application/json'):
@@ -57,7 +62,8 @@ def edit_wheel(request, config: str):
     if not request.user.has_perm('edit_wheel'):
         return HttpResponseForbidden("Access denied")
     
-    if config not in settings.WHEEL_CONFIGS:
+    wheels = get_wheels()
+    if config not in wheels:
         return HttpResponseBadRequest("Unknown wheel configuration")
 
     file_path = _get_wheel_file_path(config)
@@ -66,7 +72,7 @@ def edit_wheel(request, config: str):
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 file_data = json.load(f)
-            current_sectors = settings.WHEEL_CONFIGS[config]['sectors']
+            current_sectors = [sector.as_dict() for sector in wheels[config].expanded_sectors()]
             return JsonResponse({'file': file_data, 'ordered': current_sectors})
         except Exception as e:
             admin_logger.error(f"Failed to load wheel {config}: {e}")
@@ -146,30 +152,35 @@ def edit_wheel(request, config: str):
         'ticket_only': final_ticket_only,
     })
 
-    # If URL (slug) changed, rename file path accordingly
-    new_file_path = _get_wheel_file_path(final_url)
+    # Reject configs that would not load (unknown reward function, bad args...)
     try:
-        if new_file_path != file_path and os.path.exists(file_path):
-            os.replace(file_path, new_file_path)
-            file_path = new_file_path
-    except Exception as e:
-        admin_logger.error(f"wheel_edit rename_failed by={request.user.login} from={config} to={final_url} err={e}")
-        return JsonResponse({'error': f'Failed to rename file: {e}'}, status=500)
+        compile_wheel(wheel_data, final_url)
+    except ValueError as e:
+        admin_logger.error(f"wheel_edit invalid_config by={request.user.login} slug={config} err={e}")
+        return JsonResponse({'error': f'Invalid wheel configuration: {e}'}, status=400)
 
-    # Save file
+    # Save file (under the new name if URL (slug) changed)
+    new_file_path = _get_wheel_file_path(final_url)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(wheel_data, f, indent=2, ensure_ascii=False)
+        _write_wheel_file(new_file_path, wheel_data)
     except Exception as e:
         admin_logger.error(f"wheel_edit save_failed by={request.user.login} slug={final_url} err={e}")
         return JsonResponse({'error': f'Failed to write file: {e}'}, status=500)
 
+    # If URL (slug) changed, remove the old file
+    try:
+        if new_file_path != file_path and os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        admin_logger.error(f"wheel_edit rename_failed by={request.user.login} from={config} to={final_url} err={e}")
+        return JsonResponse({'error': f'Failed to rename file: {e}'}, status=500)
+
     # Reload and return
     versions = _reload_wheels_and_versions()
-    sectors = settings.WHEEL_CONFIGS.get(final_url, {}).get('sectors', [])
-    admin_logger.info(f"wheel_edit by={request.user.login} slug={final_url} title={final_title} sectors={len(sectors)} sectors={str(sectors)}")
+    wheel = get_wheels().get(final_url)
+    new_sectors = [sector.as_dict() for sector in wheel.expanded_sectors()] if wheel else []
+    admin_logger.info(f"wheel_edit by={request.user.login} slug={final_url} title={final_title} sectors={len(new_sectors)} sectors={str(new_sectors)}")
 
-    new_sectors = settings.WHEEL_CONFIGS.get(final_url, {}).get('sectors', [])
     return JsonResponse({
         'status': 'ok', 
         'sectors': new_sectors, 
@@ -232,7 +243,7 @@ def upload_wheel(request):
     # If name already exists, add numeric suffix
     base = normalized
     i = 1
-    while normalized in settings.WHEEL_CONFIGS:
+    while normalized in get_wheels():
         normalized = f"{base}-{i}"
         i += 1
 
@@ -249,6 +260,13 @@ def upload_wheel(request):
     if 'jackpots' in data:
         out['jackpots'] = data['jackpots']
 
+    # Reject configs that would not load (unknown reward function, bad args...)
+    try:
+        compile_wheel(out, normalized)
+    except ValueError as e:
+        admin_logger.error(f"wheel_upload invalid_config by={request.user.login} slug={normalized} err={e}")
+        return HttpResponseBadRequest(f'Invalid wheel configuration: {e}')
+
     # Ensure directory exists
     try:
         os.makedirs(settings.WHEEL_CONFIGS_DIR, exist_ok=True)
@@ -259,17 +277,18 @@ def upload_wheel(request):
     # Save file
     file_path = _get_wheel_file_path(normalized)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(out, f, indent=2, ensure_ascii=False)
+        _write_wheel_file(file_path, out)
     except Exception as e:
         admin_logger.error(f"wheel_upload save_failed by={request.user.login} slug={normalized} err={e}")
         return JsonResponse({'error': str(e)}, status=500)
 
     versions = _reload_wheels_and_versions()
-    sectors = settings.WHEEL_CONFIGS.get(normalized, {}).get('sectors', [])
+    wheel = get_wheels().get(normalized)
+    sectors = [sector.as_dict() for sector in wheel.definitions] if wheel else []
+    sectors_count = wheel.total_weight if wheel else 0
     admin_logger.info(
        f"wheel_upload by={request.user.login} slug={normalized} title={title} "
-       f"sectors_count={len(sectors)} sectors={str(sectors)}"
+       f"sectors_count={sectors_count} sectors={str(sectors)}"
     )
     return JsonResponse({'status': 'uploaded', 'url': normalized, 'title': title})
 
@@ -292,7 +311,7 @@ def create_wheel(request):
         return HttpResponseBadRequest('Missing url/name')
     
     normalized_name = _normalize_wheel_name(raw_name)
-    if normalized_name in settings.WHEEL_CONFIGS:
+    if normalized_name in get_wheels():
         return HttpResponseBadRequest('Wheel already exists')
     
     title = payload.get('title') or normalized_name.capitalize()
@@ -305,15 +324,16 @@ def create_wheel(request):
     
     file_path = _get_wheel_file_path(normalized_name)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(wheel_data, f, indent=2, ensure_ascii=False)
+        _write_wheel_file(file_path, wheel_data)
     except Exception as e:
         admin_logger.error(f"wheel_create save_failed by={request.user.login} slug={normalized_name} err={e}")
         return JsonResponse({'error': str(e)}, status=500)
     
     versions = _reload_wheels_and_versions()
-    sectors = settings.WHEEL_CONFIGS.get(normalized_name, {}).get('sectors', [])
-    admin_logger.info(f"wheel_create by={request.user.login} slug={normalized_name} title={title} sectors_count={len(sectors)} sectors={str(sectors)}")
+    wheel = get_wheels().get(normalized_name)
+    sectors = [sector.as_dict() for sector in wheel.definitions] if wheel else []
+    sectors_count = wheel.total_weight if wheel else 0
+    admin_logger.info(f"wheel_create by={request.user.login} slug={normalized_name} title={title} sectors_count={sectors_count} sectors={str(sectors)}")
     return JsonResponse({'status': 'created', 'url': normalized_name, 'title': title})
 
 
@@ -324,7 +344,7 @@ def delete_wheel(request, config: str):
     if not request.user.has_perm('edit_wheel'):
         return HttpResponseForbidden("Modification access denied")
     
-    if config not in settings.WHEEL_CONFIGS:
+    if config not in get_wheels():
         return HttpResponseBadRequest('Unknown wheel')
     
     # Remove file
@@ -336,16 +356,15 @@ def delete_wheel(request, config: str):
         admin_logger.error(f"wheel_delete delete_failed by={request.user.login} slug={config} err={e}")
         return JsonResponse({'error': f'Cannot delete file: {e}'}, status=500)
     
-    # Remove from memory and update session if needed
-    del settings.WHEEL_CONFIGS[config]
+    # Reload and update session if needed
+    versions = _reload_wheels_and_versions()
     if request.session.get('wheel_config_type') == config:
-        fallback = next(iter(settings.WHEEL_CONFIGS.keys()), None)
+        fallback = next(iter(get_wheels().keys()), None)
         request.session['wheel_config_type'] = fallback
     
     # Remove all tickets linked to this wheel
     Ticket.objects.filter(wheel_slug=config).delete()
 
-    versions = _reload_wheels_and_versions()
     admin_logger.info(f"wheel_delete by={request.user.login} slug={config}")
     return JsonResponse({'status': 'deleted', 'name': config})
 
@@ -357,7 +376,7 @@ def download_wheel(request, config: str):
     if not request.user.has_perm('admin_wheels'):
         return HttpResponseForbidden("Access denied")
     
-    if config not in settings.WHEEL_CONFIGS:
+    if config not in get_wheels():
         return HttpResponseBadRequest('Unknown wheel')
     
     file_path = _get_wheel_file_path(config)
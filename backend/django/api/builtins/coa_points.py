@@ -1,3 +1,7 @@
+import asyncio
+
+from api.intra_profile import get_profile, get_membership, store_membership, invalidate_membership
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # 
 # Give or take coalition points to a user's coalition
@@ -54,6 +58,15 @@
 # Intra Required Permissions: Advanced Staff
 # This is completely stup*d btw...
 
+# Async reward: api_intra is an AsyncIntraAPI, independent requests are gathered
+# (profile + coalitions_users, then blocs, then the score). The user's campus,
+# cursus and coalitions are read from its IntraProfile (api/intra_profile.py).
+# The resolved coalition is then kept in CoalitionMembership (api/models.py):
+# until it is a day old, or Intra rejects it, a spin only sends the score POST.
+
+# Client errors meaning the stored coalition / coalitions_user is not the user's anymore
+MEMBERSHIP_MOVED_STATUS = (404, 422)
+
 
 def _sort_cursus_priority(cursus_users: dict) -> int:
     """Sort cursus_users by priority:
@@ -105,14 +118,14 @@ def _get_user_primary_campus(user_data: dict) -> tuple[bool, str, dict]:
     return True, "Primary campus found.", primary_campus
 
 
-def _get_coalition(api_intra: object, user: object) -> tuple[bool, str, dict]:
-    """Fetch all required data then call _get_primary_coalition to get user's primary coalition."""
-    # Getting user data
-    success, msg, udata = api_intra.request('GET', f'/v2/users/{user.intra_id}')
+async def _get_coalition(api_intra: object, user: object, fresh: bool = False) -> tuple[bool, str, dict]:
+    """Load the user's Intra profile then call _get_primary_coalition to get user's primary coalition.
+    The profile (campus, cursus, coalitions) comes from the database (see api/intra_profile.py), and
+    blocs GETs are cached (see api/intra_cache.py): once per hour per campus, not once per spin."""
+    success, msg, profile = await get_profile(api_intra, user, fresh_coalitions=fresh)
     if not success:
-        return False, f"Failed to fetch user data for {user.login}: {msg}", udata
-    if not udata or not isinstance(udata, dict):
-        return False, f"User data not found/corrupted for {user.login}.", udata
+        return False, msg, profile
+    udata = profile.as_user_data()
     
     # Extracting user's primary campus
     success, msg, primary_campus = _get_user_primary_campus(udata)
@@ -120,15 +133,13 @@ def _get_coalition(api_intra: object, user: object) -> tuple[bool, str, dict]:
     if not campus_id:
         return False, f"Primary campus ID not found for {user.login}.", udata
 
-    # Get user's coalitions
-    success, msg, user_coalitions = api_intra.request('GET', f'/v2/users/{user.intra_id}/coalitions')
-    if not success:
-        return False, f"Failed to fetch coalitions data for {user.login}: {msg}", user_coalitions
+    # Check user's coalitions
+    user_coalitions = profile.coalitions
     if not user_coalitions or not isinstance(user_coalitions, list) or len(user_coalitions) == 0:
         return False, f"Coalitions data not found/corrupted for {user.login}.", user_coalitions
 
     # Get v2/bloc with campus_id
-    success, msg, blocs_data = api_intra.request('GET', f'/v2/blocs?filter[campus_id]={campus_id}')
+    success, msg, blocs_data = await api_intra.request('GET', f'/v2/blocs?filter[campus_id]={campus_id}', cache=True)
     if not success:
         return False, f"Failed to fetch blocs data for {user.login}: {msg}", blocs_data
     if not blocs_data or not isinstance(blocs_data, list) or len(blocs_data) == 0:
@@ -138,13 +149,50 @@ def _get_coalition(api_intra: object, user: object) -> tuple[bool, str, dict]:
     success, msg, data = _get_primary_coalition(user_coalitions, blocs_data, udata)
     if not success:
         return False, msg, data
-    return True, "Primary coalition found.", data
+    return True, "Primary coalition found.", {**data, 'campus_id': campus_id}
+
+
+async def _resolve_membership(api_intra: object, user: object, fresh: bool = False) -> tuple[bool, str, object]:
+    """Resolve the user's primary coalition and coalitions_user, and store them.
+    fresh: the stored one was rejected, don't trust the stored/cached coalitions either."""
+    if fresh:
+        api_intra.invalidate_cache(f'/v2/users/{user.intra_id}/coalitions')  # and coalitions_users
+
+    # Get user's primary coalition, and coalition_user_id from user_id (independent requests)
+    (success, msg, data), coa_users = await asyncio.gather(
+        _get_coalition(api_intra, user, fresh),
+        api_intra.request(method='GET', url=f'/v2/users/{user.intra_id}/coalitions_users', headers={}, cache=True),
+    )
+    if not success:
+        return False, msg, data
+
+    coa_id = data.get('id', None)
+    if not coa_id:
+        return False, f"Coalition ID not found for user {user.login}.", data
+    campus_id = data.get('campus_id', None)
+
+    success, msg, data = coa_users
+    coa_user = None
+    if success and isinstance(data, list):
+        coa_user = next((cu for cu in data if isinstance(cu, dict) and cu.get('coalition_id', None) == coa_id), None)
+    # Without it, coa points will be given but not linked to a specific coalition user
+    coa_user_id = coa_user.get('id', None) if coa_user else None
+
+    return True, "Coalition membership resolved.", await store_membership(user, coa_id, coa_user_id, campus_id)
 
 
-def coa_points(api_intra: object, user: object, args: dict) -> tuple[bool, str, dict]:
+def _membership_moved(data) -> bool:
+    """Whether an Intra error suggests the stored membership is outdated (user changed coalition)."""
+    if not isinstance(data, ValueError) or not data.args or not isinstance(data.args[0], dict):
+        return False
+    body = data.args[0]
+    return body.get('error_kind') == 'ClientError' and body.get('status_code') in MEMBERSHIP_MOVED_STATUS
+
+
+async def coa_points(api_intra: object, user: object, args: dict) -> tuple[bool, str, dict]:
     """Add or remove points from a coalition.
     Args:   
-        api_intra: IntraAPI instance
+        api_intra: AsyncIntraAPI instance
         user: User object
         args: dict with keys:
             - amount: int, positive to add points, negative to remove points
@@ -153,8 +201,11 @@ def coa_points(api_intra: object, user: object, args: dict) -> tuple[bool, str,
         tuple: (success: bool, message: str, data: dict)
 
     used api endpoints:
-    - GET /v2/users/{login}/coalitions
     - POST /v2/coalitions/:coalition_id/scores
+    - when the coalition membership isn't stored yet, is stale or was rejected:
+        - GET /v2/users/:id, GET /v2/users/:id/coalitions (see api/intra_profile.py)
+        - GET /v2/blocs?filter[campus_id]=:campus_id
+        - GET /v2/users/:id/coalitions_users
     """
 
     # Validate args
@@ -172,42 +223,42 @@ def coa_points(api_intra: object, user: object, args: dict) -> tuple[bool, str,
     # Search for template args in reason
     reason = reason.replace('{login}', user.login)
 
-    # Get user's primary coalition
-    success, msg, data = _get_coalition(api_intra, user)
-    if not success:
-        return False, msg, data
-    
-    coa_id = data.get('id', None)
-    if not coa_id:
-        return False, f"Coalition ID not found for user {user.login}.", data
-    
-    # Get coalition_user_id from user_id
-    success, msg, data  = api_intra.request(method='GET', url=f'/v2/users/{user.intra_id}/coalitions_users', headers={})
-    if not success or not isinstance(data, list) or not data or data[0].get('coalition_id', None) != coa_id:
-        # coa points will be given but not linked to a specific coalition user
-        coa_user_id = None
-    else:
-        coa_user_id = data[0].get('id', None)
-
-    # Sending points change request
-    payload = {
-        "score[value]": amount,
-        "score[reason]": reason,
-        "score[coalitions_user_id]": coa_user_id
-    }
-    success, msg, n_data = api_intra.request(method='POST', url=f'/v2/coalitions/{coa_id}/scores', headers={}, data=payload)
-    return success, msg, n_data
-
-
-def cancel_coa_points(api_intra: object, user: object, args: dict) -> tuple[bool, str, dict]:
+    # Stored coalition membership, resolved from Intra when missing or stale
+    membership = await get_membership(user)
+    stored = membership is not None
+    if not stored:
+        success, msg, membership = await _resolve_membership(api_intra, user)
+        if not success:
+            return False, msg, membership
+
+    while True:
+        # Sending points change request
+        payload = {
+            "score[value]": amount,
+            "score[reason]": reason,
+            "score[coalitions_user_id]": membership.coalitions_user_id
+        }
+        success, msg, n_data = await api_intra.request(method='POST', url=f'/v2/coalitions/{membership.coalition_id}/scores', headers={}, data=payload)
+        if success or not stored or not _membership_moved(n_data):
+            return success, msg, n_data
+
+        # Rejected stored membership: resolve it again (fresh coalitions) and retry once
+        stored = False
+        await invalidate_membership(user)
+        success, msg, membership = await _resolve_membership(api_intra, user, fresh=True)
+        if not success:
+            return False, msg, membership
+
+
+async def cancel_coa_points(api_intra: object, user: object, args: dict) -> tuple[bool, str, dict]:
     """Cancel a coalition points change by its ID.
     Args:   
-        api_intra: IntraAPI instance
+        api_intra: AsyncIntraAPI instance
         user: User object
         args: dict with keys:
             - data of the original coa_points call, must include:
                 - id: int, ID of the coalition points change to cancel
-                - coalition_id: int, ID of the coalition
+                - coalition_id: int, ID of the coalition (default: the user's stored coalition membership)
     Returns:
         tuple: (success: bool, message: str, data: dict)
 
@@ -222,16 +273,24 @@ def cancel_coa_points(api_intra: object, user: object, args: dict) -> tuple[bool
         return False, "'id' argument must be a valid integer for cancel_coa_points.", args
     if int(args.get('id')) <= 0:
         return False, "'id' argument must be a positive integer for cancel_coa_points.", args
+    coalition_id = args.get('coalition_id')
+    if coalition_id is None:
+        # Older data without it: the user's stored coalition membership
+        membership = await get_membership(user)
+        coalition_id = membership.coalition_id if membership else None
     try:   
-        int(args.get('coalition_id'))
+        int(coalition_id)
     except (ValueError, TypeError):
         return False, "'coalition_id' argument must be a valid integer for cancel_coa_points.", args
-    if int(args.get('coalition_id')) <= 0:
+    if int(coalition_id) <= 0:
         return False, "'coalition_id' argument must be a positive integer for cancel_coa_points.", args
 
     # Sending cancel request
-    success, msg, data = api_intra.request(method='DELETE', url=f"/v2/coalitions/{args.get('coalition_id')}/scores/{args.get('id')}", headers={}, data={})
+    success, msg, data = await api_intra.request(method='DELETE', url=f"/v2/coalitions/{coalition_id}/scores/{args.get('id')}", headers={}, data={})
 
     if not success:
+        if _membership_moved(data):
+            # Coalition changed since the spin: the next coa_points resolves it again
+            await invalidate_membership(user)
         return False, f"Failed to cancel coalition points change ID {args.get('id')}: {msg}", data
     return success, msg, data
@@ -1,5 +1,5 @@
 from wheel.models import Ticket, User
-from django.conf import settings
+from wheel.registry import get_wheels
 
 # # # # # # # # # # # # # # # # # # # # # 
 # Grant Ticket to a user for a given wheel
@@ -30,10 +30,10 @@ def ticket(api_intra: object, user: object, args: dict) -> tuple[bool, str, dict
         return False, "Missing wheel", {}
 
     # Validate wheel exists
-    wheels = getattr(settings, 'WHEEL_CONFIGS', {})
+    wheels = get_wheels()
     if wheel_slug not in wheels:
         return False, "Unknown wheel slug", {}
-    if not wheels[wheel_slug].get('ticket_only', False):
+    if not wheels[wheel_slug].ticket_only:
         return False, "Wheel is not ticket-only", {}
 
     t = Ticket.objects.create(user=user, wheel_slug=wheel_slug, granted_by=None)
@@ -54,7 +54,7 @@ def cancel_ticket(api_intra: object, user: object, args: dict) -> tuple[bool, st
     if not wheel_slug:
         return False, "Missing wheel", {}
 
-    ticket = Ticket.objects.filter(user=user, wheel_slug=wheel_slug, used_at__isnull=True).first()
+    ticket = Ticket.objects.unused_tickets(user, wheel_slug).first()
     if not ticket:
         return True, "No unused ticket found for this user and wheel", {}
 
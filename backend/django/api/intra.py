@@ -1,7 +1,14 @@
-import time, asyncio, httpx
-from asgiref.sync import async_to_sync
+import time, asyncio, os, threading, weakref, httpx
+from concurrent.futures import Future
+
+from django.conf import settings
 
 from ft_wheel.utils import docker_secret
+from .intra_token import SharedTokenStore, REFRESH_AHEAD, EXPIRY_MARGIN
+from .intra_ratelimit import SharedRateLimiter, priority_context
+from .intra_cache import IntraResponseCache, cache_ttl
+from .intra_breaker import BreakerRegistry, backoff_delay
+from .intra_metrics import IntraMetrics
 
 oauth_secrets = {
     'oauth_uid': docker_secret("oauth_uid"),
@@ -16,8 +23,8 @@ oauth_secrets = {
 class AsyncIntraAPI:
     """
     Async client for the 42 intra API.
-    Designed to be used with asyncio (await) or with asgiref.sync.async_to_sync
-    from sync contexts.
+    Designed to be used with asyncio (await). Sync code goes through IntraAPI,
+    which runs every request on one long-lived event loop (IntraLoopThread).
     """
 
     TOKEN_URL = "https://api.intra.42.fr/oauth/token"
@@ -26,13 +33,27 @@ class AsyncIntraAPI:
         # If not provided, fallback to oauth_secrets imported from users.views
         self.client_id = client_id if client_id is not None else oauth_secrets.get("oauth_uid")
         self.client_secret = client_secret if client_secret is not None else oauth_secrets.get("oauth_secret")
-        self.api_url = api_url
-
-        # token state (kept in-memory)
+        self.api_url = api_url.rstrip('/')
+        # the token endpoint follows the API (e.g. a local stand-in, see intra_standin.py)
+        self.TOKEN_URL = f"{self.api_url}/oauth/token"
+
+        # token state: shared between processes through the token store,
+        # with an in-memory copy served until the refresh window
+        self._token_store = SharedTokenStore()
+        self._token_entry = None
         self._token = None
         self._token_expiry_ts = 0.0 # timestamp when token expires
-        # async lock(s): handle errors with multiple event loops
-        self._locks_by_loop: dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+        # quota shared with the other processes (see intra_ratelimit.py)
+        self._rate_limiter = SharedRateLimiter()
+        # opt-in GET response cache (see intra_cache.py)
+        self._cache = IntraResponseCache()
+        # circuit breaker per endpoint family (see intra_breaker.py)
+        self._breakers = BreakerRegistry()
+        # per-route counters and latency histograms (see intra_metrics.py)
+        self._metrics = IntraMetrics()
+        # async lock(s): one per event loop using this client (normally only the
+        # IntraLoopThread one), dropped with their loop
+        self._locks_by_loop: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = weakref.WeakKeyDictionary()
 
         # reuse AsyncClient to benefit from connection pooling
         self._client = httpx.AsyncClient(timeout=30.0)
@@ -40,7 +61,51 @@ class AsyncIntraAPI:
     def _token_valid(self) -> bool:
         if not self._token:
             return False
-        return time.time() < (self._token_expiry_ts)
+        return time.time() < (self._token_expiry_ts - REFRESH_AHEAD)
+
+    async def _fetch_token(self) -> tuple[dict, float]:
+        """Ask /oauth/token for a new token. Returns (token, expires_in)."""
+        self._metrics.token_fetched()
+        resp = await self._client.post(
+            self.TOKEN_URL,
+            data={
+                "grant_type": "client_credentials",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "scope": "public profile tig"
+            },
+            timeout=10.0
+        )
+        resp.raise_for_status()
+        token = resp.json()
+
+        expires_in = token.get("expires_in", 3600)
+        # fallback if the value is missing/incorrect
+        if not isinstance(expires_in, (int, float)) or expires_in <= 0:
+            expires_in = 3600
+        return token, expires_in
+
+    def _token_lock(self) -> asyncio.Lock:
+        """Token lock of the running loop: one coroutine at a time uses the token store (and its flock)."""
+        loop = asyncio.get_running_loop()
+        lock = self._locks_by_loop.get(loop)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks_by_loop[loop] = lock
+        return lock
+
+    async def _invalidate_token(self, rejected: dict):
+        """Drop a token rejected with a 401, unless another request already replaced it."""
+        async with self._token_lock():
+            if self._token is None or self._token.get('access_token') != rejected.get('access_token'):
+                return
+            self._token = None
+            self._token_entry = None
+            self._token_expiry_ts = 0.0
+            try:
+                await self._token_store.invalidate(rejected['access_token'])
+            except OSError:
+                pass
 
     async def _get_token(self):
         """
@@ -50,45 +115,29 @@ class AsyncIntraAPI:
         if self._token_valid():
             return self._token
 
-        loop = asyncio.get_running_loop()
-        lock = self._locks_by_loop.get(loop)
-        if lock is None:
-            lock = asyncio.Lock()
-            self._locks_by_loop[loop] = lock
-
-        async with lock:
+        async with self._token_lock():
             if self._token_valid():
                 return self._token
 
-            # fetch new token
-            resp = await self._client.post(
-                self.TOKEN_URL,
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "scope": "public profile tig"
-                },
-                timeout=10.0
-            )
-            resp.raise_for_status()
-            token = resp.json()
-
-            now = time.time()
-            expires_in = token.get("expires_in", 3600)
-            # fallback if the value is missing/incorrect
-            if not isinstance(expires_in, (int, float)) or expires_in <= 0:
-                expires_in = 3600
-            # small safety margin
-            self._token_expiry_ts = now + expires_in - 10
-
-            self._token = token
+            # Shared store: reuse the token of another process, or refresh it
+            # (once for all processes) when it is about to expire
+            try:
+                entry = await self._token_store.get(self._fetch_token, self._token_entry)
+            except OSError:
+                # Store unusable (e.g. read-only state dir): token kept by this process only
+                token, expires_in = await self._fetch_token()
+                entry = {'token': token, 'expires_at': time.time() + expires_in - EXPIRY_MARGIN}
+            self._token_entry = entry
+            self._token = entry['token']
+            self._token_expiry_ts = entry['expires_at']
             return self._token
 
 
-    async def request(self, method: str, url: str, headers: dict = None, **kwargs) -> tuple[bool, str, dict]:
+    async def request(self, method: str, url: str, headers: dict = None, cache: bool = False, **kwargs) -> tuple[bool, str, dict]:
         """
         Make an authenticated HTTP request to the Intra API.
+        With cache=True, a GET on an endpoint listed in intra_cache.CACHE_TTLS is served
+        from the response cache, and concurrent identical GETs share one request.
 
         Returns:
             tuple[bool, str, dict]: (success, message, data)
@@ -101,40 +150,78 @@ class AsyncIntraAPI:
         else:
             full_url = url
 
+        try:
+            if cache and method.upper() == 'GET':
+                ttl = cache_ttl(full_url)
+                if ttl:
+                    key = self._cache.key(full_url, kwargs.get('params'))
+                    return await self._cache.get_or_fetch(
+                        key, ttl, lambda: self._request(method, full_url, headers, **kwargs)
+                    )
+            return await self._request(method, full_url, headers, **kwargs)
+        finally:
+            if self._metrics.flush_due():
+                await self._flush_metrics()
+
+    async def _request(self, method: str, full_url: str, headers: dict = None, **kwargs) -> tuple[bool, str, dict]:
+        breaker = self._breakers.for_url(full_url)
         attempts = 0
         while attempts < 3:
             attempts += 1
 
+            # Intra degraded on this endpoint family: fail fast, the request is not sent
+            if not breaker.allow():
+                self._metrics.request_rejected()
+                return False, (
+                    f"Circuit open for '{breaker.name}': request not sent (Intra unavailable)\n"
+                    f"{method}\n{full_url}"
+                ), {'error_kind': 'CircuitOpen', 'retry_in': breaker.retry_in()}
+
             # ensure we have a token
             try:
                 token = await self._get_token()
             except Exception as e:
+                breaker.release()
                 return False, f"Token fetch failed: {str(e)}", {}
 
             # prepare headers
             req_headers = dict(headers) if headers else {}
             req_headers["Authorization"] = f"Bearer {token['access_token']}"
 
+            # wait for the shared quota; shed the request rather than waiting too long
+            waiting_since = time.monotonic()
+            allowed = await self._rate_limiter.acquire()
+            waited = time.monotonic() - waiting_since
+            if waited >= 0.01:
+                self._metrics.rate_limit_wait(waited)
+            if not allowed:
+                breaker.release()
+                self._metrics.request_shed()
+                return False, f"Rate limit: request not sent (Intra quota exhausted)\n{method}\n{full_url}", {'error_kind': 'RateLimited'}
+
+            started = time.monotonic()
             try:
                 # Do the request
                 resp = await self._client.request(method, full_url, headers=req_headers, **kwargs)
                 rc = resp.status_code
+                self._metrics.observe(method, full_url, rc, time.monotonic() - started)
+                self._metrics.quota_seen(resp.headers)
+                await self._rate_limiter.observe(resp.headers, rc)
 
-                # Rate limit -> respect Retry-After and retry
+                # Rate limit -> Retry-After is applied by the limiter to every process, retry
                 if rc == 429:
-                    retry_after = resp.headers.get("Retry-After")
-                    try:
-                        sleep_seconds = float(retry_after) if retry_after is not None else 1.0
-                    except Exception:
-                        sleep_seconds = 1.0
-                    await asyncio.sleep(sleep_seconds)
+                    breaker.release()
+                    self._metrics.retry('rate_limited')
                     continue
 
+                # 5xx and network errors count as failures, client errors don't
+                breaker.record(rc >= 500, time.monotonic() - started)
+
                 # Authorization problem -> invalidate token and retry once
                 if rc == 401:
-                    # invalider proprement le token (pas besoin de toucher aux locks)
-                    self._token = None
-                    self._token_expiry_ts = 0.0
+                    # invalider proprement le token, pour tous les process s'il n'a pas déjà été remplacé
+                    await self._invalidate_token(token)
+                    self._metrics.retry('unauthorized')
                     await asyncio.sleep(0.5)
                     continue
 
@@ -149,7 +236,9 @@ class AsyncIntraAPI:
                 if rc >= 400:
                     if rc < 500:
                         body['error_kind'] = 'ClientError'
-                        raise ValueError(body)
+                        body['status_code'] = rc
+                        # Same request, same answer: not retried
+                        return False, self._error_message(attempts, method, full_url, kwargs), ValueError(body)
                     else:
                         body['error_kind'] = 'ServerError'
                         raise ValueError(body)
@@ -162,28 +251,128 @@ class AsyncIntraAPI:
                 return True, str(msg), body
 
             except Exception as e:
+                if not isinstance(e, ValueError):
+                    # Network error / timeout (a 5xx is already recorded)
+                    breaker.record(True, time.monotonic() - started)
+                    self._metrics.observe(method, full_url, 0, time.monotonic() - started)
                 if attempts >= 3:
-                    error_msg = (
-                        f"Request error after {attempts} attempt(s) for\n"
-                        f"{method}\n{full_url}\n"
-                        f"---\n{kwargs.get('data') or kwargs.get('json') or ''}\n---\n"
-                    )
+                    error_msg = self._error_message(attempts, method, full_url, kwargs)
                     try:
                         return False, str(error_msg), e
                     except Exception:
                         return False, str(error_msg), {'error': str(e)}
-                await asyncio.sleep(1)
+                # jittered exponential backoff, so retries don't hit Intra in waves
+                self._metrics.retry('server_error' if isinstance(e, ValueError) else 'network_error')
+                await asyncio.sleep(backoff_delay(attempts))
                 continue
 
         # Should not happen
         return False, "Request failed for unknown reason", {}
 
 
+    @staticmethod
+    def _error_message(attempts: int, method: str, full_url: str, kwargs: dict) -> str:
+        return (
+            f"Request error after {attempts} attempt(s) for\n"
+            f"{method}\n{full_url}\n"
+            f"---\n{kwargs.get('data') or kwargs.get('json') or ''}\n---\n"
+        )
+
+    def breaker_states(self) -> dict:
+        """State of the circuit breaker of each endpoint family seen so far."""
+        return self._breakers.states()
+
+    def invalidate_cache(self, path_prefix: str = ''):
+        """Drop cached GET responses whose path starts with path_prefix (e.g. after a write)."""
+        self._cache.invalidate(path_prefix)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/coalesced counters of the GET response cache."""
+        return self._cache.stats()
+
+    def flush_metrics(self):
+        """Write this process' metrics snapshot (with its cache and breakers) for intra_metrics.collect()."""
+        self._metrics.flush({'cache': self.cache_stats(), 'breakers': self.breaker_states()})
+
+    async def _flush_metrics(self):
+        try:
+            await asyncio.to_thread(self.flush_metrics)
+        except OSError:
+            pass
+
+
     async def close(self):
         """Close underlying HTTP client. Call on shutdown if desired."""
         await self._client.aclose()
 
 
+# ---------------------
+# Event loop thread for sync callers
+# ---------------------
+class IntraLoopThread:
+    """
+    One event loop running forever in a daemon thread, owning the AsyncIntraAPI
+    client and its connection pool. Sync code submits coroutines to it and waits
+    for their result, instead of creating an event loop per call (async_to_sync),
+    so HTTP keep-alive connections are really reused.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        loop = self._loop
+        if loop is not None:
+            return loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run, args=(loop,), name='intra-api-loop', daemon=True)
+                thread.start()
+                self._thread = thread
+                self._loop = loop
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def run(self, coro_func, *args, **kwargs):
+        """Run coro_func(*args, **kwargs) on the loop thread and return its result (blocking).
+        Only the Intra request priority is carried over from the caller's context: the
+        other contextvars (asgiref's thread-sensitive executor of the calling request)
+        would make sync_to_async calls in the task wait on the blocked caller thread."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("IntraAPI (sync) called from the Intra event loop: await AsyncIntraAPI instead.")
+        loop = self._ensure_loop()
+        context = priority_context()
+        result = Future()
+
+        def start():
+            task = loop.create_task(coro_func(*args, **kwargs), context=context)
+
+            def done(task):
+                if task.cancelled():
+                    result.set_exception(asyncio.CancelledError())
+                elif task.exception() is not None:
+                    result.set_exception(task.exception())
+                else:
+                    result.set_result(task.result())
+            task.add_done_callback(done)
+
+        loop.call_soon_threadsafe(start)
+        return result.result()
+
+    def reset(self):
+        """Forget the loop (child process after a fork: the thread does not exist there)."""
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+
 # ---------------------
 # Sync wrapper for AsyncIntraAPI
 # ---------------------
@@ -191,13 +380,31 @@ class AsyncIntraAPI:
 _async_api_singleton = AsyncIntraAPI(
     client_id=oauth_secrets.get("oauth_uid"),
     client_secret=oauth_secrets.get("oauth_secret"),
-    api_url="https://api.intra.42.fr"
+    api_url=settings.INTRA_API_URL
 )
 
+_loop_thread = IntraLoopThread()
+
+
+def _after_fork_in_child():
+    # The parent's loop thread and pooled connections are not usable in the child
+    _loop_thread.reset()
+    _async_api_singleton._client = httpx.AsyncClient(timeout=30.0)
+    _async_api_singleton._locks_by_loop = weakref.WeakKeyDictionary()
+    _async_api_singleton._metrics = IntraMetrics()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def run_in_intra_loop(coro_func, *args, **kwargs):
+    """Run an async function (e.g. an async reward) on the Intra event loop thread, from sync code."""
+    return _loop_thread.run(coro_func, *args, **kwargs)
+
+
 class IntraAPI():
     """
     Synchronous wrapper around AsyncIntraAPI for use in sync contexts.
-    Uses asgiref.sync.async_to_sync to call async methods.
+    Requests run on the shared Intra event loop thread (IntraLoopThread).
     """
     def __init__(self, client_id: str = None, client_secret: str = None, api_url: str = "https://api.intra.42.fr"):
         # Tous les wrappers partagent la même AsyncIntraAPI
@@ -206,7 +413,7 @@ class IntraAPI():
     def request(self, method: str, url: str, headers: dict = None, **kwargs) -> tuple[bool, str, dict]:
         """
         Make an authenticated HTTP request to the Intra API.
-        This is a synchronous wrapper around AsyncIntraAPI.request using async_to_sync.
+        This is a synchronous wrapper around AsyncIntraAPI.request, run on the Intra event loop thread.
         
         Returns (success: bool, response: str, body: dict)
 
@@ -214,20 +421,36 @@ class IntraAPI():
          - method: HTTP method (GET, POST, etc)
          - url: subPath (e.g. '/v2/users/me' will result to 'https://api.intra.42.fr/v2/users/me')
          - headers: optional dict of HTTP headers
+         - cache: serve GETs of cacheable endpoints from the response cache (see intra_cache.py)
          - **kwargs: additional arguments passed to httpx request (e.g. json=..., data=..., params=...)
             - For a POST, passing payload as 'data=<dict>' works well.
         """
         try:
-            return async_to_sync(self._async_api.request)(method, url, headers, **kwargs)
+            return _loop_thread.run(self._async_api.request, method, url, headers, **kwargs)
         except Exception as e:
             return False, str(e), {}
 
+    def invalidate_cache(self, path_prefix: str = ''):
+        self._async_api.invalidate_cache(path_prefix)
+
+    def cache_stats(self) -> dict:
+        return self._async_api.cache_stats()
+
+    def breaker_states(self) -> dict:
+        return self._async_api.breaker_states()
+
+    def flush_metrics(self):
+        self._async_api.flush_metrics()
+
 
 # ---------------------
-# Export single instance
+# Export single instances
 # ---------------------
+# For async rewards (run on the Intra event loop thread)
+async_intra_api = _async_api_singleton
+
 intra_api = IntraAPI(
     client_id=oauth_secrets.get("oauth_uid"),
     client_secret=oauth_secrets.get("oauth_secret"),
-    api_url="https://api.intra.42.fr"
+    api_url=settings.INTRA_API_URL
 )
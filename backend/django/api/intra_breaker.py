@@ -0,0 +1,145 @@
+import random, re, threading, time
+from collections import deque
+from urllib.parse import urlsplit
+
+from .jackpot_logging import logger
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Intra API circuit breaker
+#
+# One breaker per endpoint family (/v2/users/..., /v2/coalitions/..., ...).
+# CLOSED: requests go through, their outcome is recorded over WINDOW seconds.
+# When enough of them fail (5xx, network error) or are too slow, the breaker
+# OPENs: requests fail immediately, without being sent, for OPEN_SECONDS.
+# Then it is HALF_OPEN: one probe request is let through, its outcome closes
+# or re-opens the breaker. State changes go to the jackpot logger.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Seconds of outcomes taken into account
+WINDOW = 30.0
+# Outcomes needed in the window before the breaker can open
+MIN_CALLS = 5
+# Share of failed / slow calls that opens the breaker
+FAILURE_RATE = 0.5
+SLOW_RATE = 0.5
+# A call longer than this (seconds) counts as slow
+SLOW_CALL = 5.0
+# Seconds an open breaker rejects requests before letting a probe through
+OPEN_SECONDS = 30.0
+
+# Retry backoff: full jitter over BACKOFF_BASE * 2^(attempt - 1), capped
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry number `attempt` (1-based)."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def endpoint_family(url: str) -> str:
+    """'https://api.intra.42.fr/v2/users/42/coalitions' -> 'v2/users'"""
+    segments = [s for s in urlsplit(url).path.split('/') if s]
+    if segments and re.fullmatch(r'v\d+', segments[0]):
+        return '/'.join(segments[:2])
+    return segments[0] if segments else ''
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        # (timestamp, failed, slow)
+        self.outcomes = deque()
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str, reason: str = ''):
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        message = f"Intra circuit breaker '{self.name}': {previous} -> {state}{f' ({reason})' if reason else ''}"
+        if state == OPEN:
+            logger.error(message)
+        else:
+            logger.info(message)
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (False: fail fast)."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < OPEN_SECONDS:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probe_in_flight:
+                    return False
+                self.probe_in_flight = True
+            return True
+
+    def retry_in(self) -> float:
+        """Seconds before an open breaker lets a probe through."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, OPEN_SECONDS - (time.monotonic() - self.opened_at))
+
+    def record(self, failed: bool, latency: float):
+        """Record the outcome of a request allowed by allow()."""
+        now = time.monotonic()
+        slow = latency >= SLOW_CALL
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+                if failed or slow:
+                    self.opened_at = now
+                    self._set_state(OPEN, "probe failed" if failed else f"probe took {latency:.1f}s")
+                else:
+                    self.outcomes.clear()
+                    self._set_state(CLOSED, "probe succeeded")
+                return
+
+            self.outcomes.append((now, failed, slow))
+            while self.outcomes and now - self.outcomes[0][0] > WINDOW:
+                self.outcomes.popleft()
+            calls = len(self.outcomes)
+            if self.state != CLOSED or calls < MIN_CALLS:
+                return
+            failures = sum(1 for _, f, _ in self.outcomes if f)
+            slows = sum(1 for _, _, s in self.outcomes if s)
+            if failures / calls >= FAILURE_RATE or slows / calls >= SLOW_RATE:
+                self.opened_at = now
+                self.outcomes.clear()
+                self._set_state(OPEN, f"{failures}/{calls} failed, {slows}/{calls} slow in {WINDOW:.0f}s")
+
+    def release(self):
+        """Give back a half-open probe slot without an outcome (request not sent / not judged)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'state': self.state, 'calls': len(self.outcomes)}
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        family = endpoint_family(url)
+        breaker = self._breakers.get(family)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(family, CircuitBreaker(family))
+        return breaker
+
+    def states(self) -> dict:
+        return {family: breaker.snapshot() for family, breaker in list(self._breakers.items())}
@@ -0,0 +1,110 @@
+import asyncio, copy, re, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Intra GET response cache
+#
+# Opt-in (request(..., cache=True)): builtins repeat the same GETs on every
+# spin (user, coalitions, campus blocs). Successful responses of the endpoints
+# listed in CACHE_TTLS are kept in memory for their TTL, in a bounded LRU.
+# Concurrent identical GETs share one in-flight request (single-flight), also
+# across the event loops of different threads (async_to_sync).
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# (path regex, TTL in seconds): first match wins, unlisted endpoints are never cached
+CACHE_TTLS = [
+    (re.compile(r'^/v2/blocs$'), 3600),                             # campus blocs and their coalitions
+    (re.compile(r'^/v2/users/\d+/coalitions(_users)?$'), 600),
+    (re.compile(r'^/v2/users/\d+$'), 300),
+]
+
+# Maximum number of cached responses
+MAX_ENTRIES = 1024
+
+
+def cache_ttl(url: str) -> int | None:
+    """TTL of an endpoint (path of url), or None if it must not be cached."""
+    path = urlsplit(url).path
+    for pattern, ttl in CACHE_TTLS:
+        if pattern.match(path):
+            return ttl
+    return None
+
+
+class IntraResponseCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (expires_at, (success, message, data))
+        self._entries = OrderedDict()
+        # key -> concurrent.futures.Future of the in-flight request
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(url: str, params=None) -> str:
+        if not params:
+            return url
+        return f"{url}|{sorted(dict(params).items())}"
+
+    async def get_or_fetch(self, key: str, ttl: int, fetch) -> tuple[bool, str, dict]:
+        """Cached response for key, or the result of `await fetch()` (cached if successful)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return copy.deepcopy(await asyncio.wrap_future(future))
+
+        try:
+            result = await fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if result[0]:
+                self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(result))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(result)
+        return result
+
+    def invalidate(self, path_prefix: str = ''):
+        """Drop the cached responses whose path starts with path_prefix (everything by default)."""
+        with self._lock:
+            for key in [k for k in self._entries if urlsplit(k).path.startswith(path_prefix)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
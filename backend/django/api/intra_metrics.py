@@ -0,0 +1,239 @@
+import json, os, re, threading, time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Intra API metrics
+#
+# Every request sent by AsyncIntraAPI is counted per method and route template
+# ('/v2/users/:id/coalitions') with its statuses and a latency histogram, next
+# to the retries, 401 token refreshes, rate limiter waits / 429s, and the last
+# remaining quota returned by Intra. Each process writes its snapshot to
+# INTRA_STATE_DIR/metrics/ (at most every FLUSH_INTERVAL seconds) and the admin
+# endpoint merges the snapshots of the live processes (collect()).
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Latency histogram bucket upper bounds (seconds), the last bucket is +inf
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds between two snapshot writes of a process
+FLUSH_INTERVAL = 5.0
+# Snapshots of dead processes are dropped after this many seconds
+STALE_AFTER = 3600.0
+
+METRICS_DIR = 'metrics'
+
+# Counted events
+RETRY_REASONS = ('server_error', 'network_error', 'unauthorized', 'rate_limited')
+
+_ID_SEGMENT = re.compile(r'^\d+$')
+
+
+def route_template(url: str) -> str:
+    """'https://api.intra.42.fr/v2/users/42/coalitions?x=1' -> '/v2/users/:id/coalitions'"""
+    segments = [s for s in urlsplit(url).path.split('/') if s]
+    return '/' + '/'.join(':id' if _ID_SEGMENT.match(s) else s for s in segments)
+
+
+def _new_route() -> dict:
+    return {'count': 0, 'statuses': {}, 'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'max': 0.0}
+
+
+def _quantile(route: dict, q: float) -> float | None:
+    """Upper bound of the bucket holding the q-quantile (None past the last bound)."""
+    target = q * route['count']
+    seen = 0
+    for bound, count in zip(BUCKETS, route['buckets']):
+        seen += count
+        if seen >= target:
+            return bound
+    return None
+
+
+class IntraMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            # 'METHOD /route/template' -> route stats
+            self.routes = {}
+            self.retries = dict.fromkeys(RETRY_REASONS, 0)
+            self.token_fetches = 0
+            self.rate_limit_waits = 0
+            self.rate_limit_wait_seconds = 0.0
+            self.shed = 0
+            self.circuit_open = 0
+            # last X-*-RateLimit-* headers seen: {'secondly': {'limit', 'remaining'}, 'hourly': ..., 'seen_at'}
+            self.quota = {}
+
+    # # # Recording (called from the Intra event loop) # # #
+
+    def observe(self, method: str, url: str, status: int, latency: float):
+        """One response (status 0: no response, network error) and its latency."""
+        key = f"{method.upper()} {route_template(url)}"
+        with self._lock:
+            route = self.routes.get(key)
+            if route is None:
+                route = self.routes[key] = _new_route()
+            route['count'] += 1
+            route['statuses'][str(status)] = route['statuses'].get(str(status), 0) + 1
+            index = next((i for i, bound in enumerate(BUCKETS) if latency <= bound), len(BUCKETS))
+            route['buckets'][index] += 1
+            route['sum'] += latency
+            route['max'] = max(route['max'], latency)
+
+    def retry(self, reason: str):
+        with self._lock:
+            self.retries[reason] = self.retries.get(reason, 0) + 1
+
+    def token_fetched(self):
+        with self._lock:
+            self.token_fetches += 1
+
+    def rate_limit_wait(self, seconds: float):
+        with self._lock:
+            self.rate_limit_waits += 1
+            self.rate_limit_wait_seconds += seconds
+
+    def request_shed(self):
+        with self._lock:
+            self.shed += 1
+
+    def request_rejected(self):
+        """Not sent: circuit open."""
+        with self._lock:
+            self.circuit_open += 1
+
+    def quota_seen(self, headers):
+        quota = {}
+        for name in ('secondly', 'hourly'):
+            limit = headers.get(f'X-{name.capitalize()}-RateLimit-Limit')
+            remaining = headers.get(f'X-{name.capitalize()}-RateLimit-Remaining')
+            if limit is None and remaining is None:
+                continue
+            try:
+                quota[name] = {'limit': int(limit) if limit is not None else None, 'remaining': int(remaining) if remaining is not None else None}
+            except ValueError:
+                continue
+        if quota:
+            with self._lock:
+                self.quota = {**quota, 'seen_at': time.time()}
+
+    # # # Snapshots # # #
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'started': self.started,
+                'updated': time.time(),
+                'routes': json.loads(json.dumps(self.routes)),
+                'retries': dict(self.retries),
+                'token_fetches': self.token_fetches,
+                'rate_limit_waits': self.rate_limit_waits,
+                'rate_limit_wait_seconds': self.rate_limit_wait_seconds,
+                'shed': self.shed,
+                'circuit_open': self.circuit_open,
+                'quota': dict(self.quota),
+            }
+
+    def flush_due(self) -> bool:
+        """Whether the snapshot should be written now (True once per FLUSH_INTERVAL)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < FLUSH_INTERVAL:
+                return False
+            self._last_flush = now
+            return True
+
+    def flush(self, extra: dict = None, state_dir: str = None):
+        """Write the snapshot of this process (blocking: call it through asyncio.to_thread from the loop)."""
+        directory = os.path.join(state_dir or settings.INTRA_STATE_DIR, METRICS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"intra_metrics.{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({**self.snapshot(), **(extra or {})}, f)
+        os.replace(tmp_path, path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_route(total: dict, route: dict):
+    total['count'] += route['count']
+    for status, count in route['statuses'].items():
+        total['statuses'][status] = total['statuses'].get(status, 0) + count
+    total['buckets'] = [a + b for a, b in zip(total['buckets'], route['buckets'])]
+    total['sum'] += route['sum']
+    total['max'] = max(total['max'], route['max'])
+
+
+def collect(state_dir: str = None) -> dict:
+    """Merge the snapshots of the live processes: totals, plus the per-process cache / breakers extras."""
+    directory = os.path.join(state_dir or settings.INTRA_STATE_DIR, METRICS_DIR)
+    try:
+        names = [n for n in os.listdir(directory) if n.startswith('intra_metrics.') and n.endswith('.json')]
+    except FileNotFoundError:
+        names = []
+
+    snapshots = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not _alive(snapshot.get('pid', 0)):
+            if time.time() - snapshot.get('updated', 0) > STALE_AFTER:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            continue
+        snapshots.append(snapshot)
+
+    routes = {}
+    retries = dict.fromkeys(RETRY_REASONS, 0)
+    quota = {}
+    totals = {'token_fetches': 0, 'rate_limit_waits': 0, 'rate_limit_wait_seconds': 0.0, 'shed': 0, 'circuit_open': 0}
+    for snapshot in snapshots:
+        for key, route in snapshot.get('routes', {}).items():
+            _merge_route(routes.setdefault(key, _new_route()), route)
+        for reason, count in snapshot.get('retries', {}).items():
+            retries[reason] = retries.get(reason, 0) + count
+        for name in totals:
+            totals[name] += snapshot.get(name, 0)
+        if snapshot.get('quota', {}).get('seen_at', 0) > quota.get('seen_at', 0):
+            quota = snapshot['quota']
+
+    for route in routes.values():
+        route['mean'] = route['sum'] / route['count'] if route['count'] else None
+        route['p50'] = _quantile(route, 0.50)
+        route['p95'] = _quantile(route, 0.95)
+        route['p99'] = _quantile(route, 0.99)
+
+    return {
+        'buckets': list(BUCKETS),
+        'routes': dict(sorted(routes.items(), key=lambda item: -item[1]['sum'])),
+        'requests': sum(route['count'] for route in routes.values()),
+        'retries': retries,
+        **totals,
+        'quota': quota,
+        'processes': [
+            {k: s.get(k) for k in ('pid', 'started', 'updated', 'cache', 'breakers')}
+            for s in sorted(snapshots, key=lambda s: s.get('pid', 0))
+        ],
+    }
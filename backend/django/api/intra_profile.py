@@ -0,0 +1,137 @@
+import asyncio, logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+
+from users.models import IntraProfile
+from api.models import CoalitionMembership
+
+logger = logging.getLogger('backend')
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Intra profile (stale-while-revalidate)
+#
+# The campus/cursus slice of a user is saved at login (users.views.callback_view)
+# and the user's coalitions the first time a reward needs them. Rewards read
+# them from the database: while fresh as is, once stale as is too but with a
+# refresh started in the background (on the Intra event loop), so the spin
+# does not wait for Intra. Only a missing profile is fetched before answering.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Age after which a profile is refreshed in the background
+PROFILE_TTL = timedelta(hours=12)
+# Age after which a coalition membership is resolved again (before the reward)
+MEMBERSHIP_TTL = timedelta(days=1)
+
+# User id -> background refresh task (also keeps a reference to the task)
+_refreshing = {}
+
+
+def _db(func):
+    """Run ORM code from the Intra event loop, without keeping a connection open in the executor thread."""
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+@_db
+def _load(user_id):
+    return IntraProfile.objects.filter(user_id=user_id).first()
+
+
+@_db
+def _store(user, user_data, coalitions):
+    return IntraProfile.objects.store(user, user_data=user_data, coalitions=coalitions)
+
+
+def _is_stale(refreshed_at) -> bool:
+    return refreshed_at is None or timezone.now() - refreshed_at > PROFILE_TTL
+
+
+async def _fetch(api_intra, user, profile: bool = True, coalitions: bool = True) -> tuple[bool, str, IntraProfile | None]:
+    """Fetch the requested parts from Intra (concurrently) and save them."""
+    requests = []
+    if profile:
+        requests.append(api_intra.request('GET', f'/v2/users/{user.intra_id}', cache=True))
+    if coalitions:
+        requests.append(api_intra.request('GET', f'/v2/users/{user.intra_id}/coalitions', cache=True))
+    results = list(await asyncio.gather(*requests))
+
+    user_data = coalitions_data = None
+    if profile:
+        success, msg, user_data = results.pop(0)
+        if not success:
+            return False, f"Failed to fetch user data for {user.login}: {msg}", user_data
+        if not user_data or not isinstance(user_data, dict):
+            return False, f"User data not found/corrupted for {user.login}.", user_data
+    if coalitions:
+        success, msg, coalitions_data = results.pop(0)
+        if not success:
+            return False, f"Failed to fetch coalitions data for {user.login}: {msg}", coalitions_data
+        if not isinstance(coalitions_data, list):
+            return False, f"Coalitions data not found/corrupted for {user.login}.", coalitions_data
+
+    return True, "Intra profile fetched.", await _store(user, user_data, coalitions_data)
+
+
+async def _refresh(api_intra, user, profile: bool, coalitions: bool):
+    try:
+        success, msg, _ = await _fetch(api_intra, user, profile=profile, coalitions=coalitions)
+        if not success:
+            logger.warning(f"Background refresh of the Intra profile of {user.login} failed: {msg}")
+    except Exception as e:
+        logger.warning(f"Background refresh of the Intra profile of {user.login} failed: {e}")
+
+
+def _refresh_in_background(api_intra, user, profile: bool, coalitions: bool):
+    if user.id in _refreshing:
+        return
+    task = asyncio.get_running_loop().create_task(_refresh(api_intra, user, profile, coalitions))
+    _refreshing[user.id] = task
+    task.add_done_callback(lambda _: _refreshing.pop(user.id, None))
+
+
+async def get_profile(api_intra, user, fresh_coalitions: bool = False) -> tuple[bool, str, IntraProfile | dict]:
+    """
+    Intra profile (campus, cursus, coalitions) of a user, from the database when possible.
+    Must run on the Intra event loop (async rewards): background refreshes outlive the reward.
+    fresh_coalitions: fetch the coalitions from Intra even if stored (known to be outdated).
+    Returns (success, message, IntraProfile), or (False, message, error data).
+    """
+    profile = await _load(user.id)
+    missing_profile = profile is None or profile.refreshed_at is None
+    missing_coalitions = profile is None or profile.coalitions is None or fresh_coalitions
+    if missing_profile or missing_coalitions:
+        return await _fetch(api_intra, user, profile=missing_profile, coalitions=missing_coalitions)
+
+    stale_profile = _is_stale(profile.refreshed_at)
+    stale_coalitions = _is_stale(profile.coalitions_refreshed_at)
+    if stale_profile or stale_coalitions:
+        _refresh_in_background(api_intra, user, stale_profile, stale_coalitions)
+    return True, "Intra profile loaded.", profile
+
+
+# # # Coalition membership (builtins.coa_points) # # #
+
+@_db
+def get_membership(user) -> CoalitionMembership | None:
+    """Resolved primary coalition of a user, None if unknown or older than MEMBERSHIP_TTL."""
+    membership = CoalitionMembership.objects.filter(user_id=user.id).first()
+    if membership is None or timezone.now() - membership.refreshed_at > MEMBERSHIP_TTL:
+        return None
+    return membership
+
+
+@_db
+def store_membership(user, coalition_id: int, coalitions_user_id: int = None, campus_id: int = None) -> CoalitionMembership:
+    return CoalitionMembership.objects.store(user, coalition_id, coalitions_user_id, campus_id)
+
+
+@_db
+def invalidate_membership(user):
+    CoalitionMembership.objects.filter(user_id=user.id).delete()
@@ -0,0 +1,195 @@
+import asyncio, contextvars, fcntl, json, os, time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Intra API rate limiter
+#
+# Intra enforces a per-second and a per-hour quota per application. Instead of
+# sending requests until a 429, every request takes a token from two buckets
+# (secondly / hourly) stored in a file of INTRA_STATE_DIR, so all the processes
+# of the container share the same quota. Limits and remaining counts are
+# corrected from the X-Secondly-/X-Hourly-RateLimit-* response headers.
+#
+# Requests wait for a token, up to a maximum depending on their priority, and
+# are shed (never sent) past it. Low priority requests (admin work) leave a
+# reserve of tokens to live spins.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+PRIORITY_LIVE = 'live'  # spin rewards (default)
+PRIORITY_LOW = 'low'    # admin cancellations, bulk/reconciliation work
+
+# Seconds a request may wait for a token before being shed
+MAX_WAIT = {
+    PRIORITY_LIVE: 15.0,
+    PRIORITY_LOW: 60.0,
+}
+
+# Quotas of a default Intra application, until the response headers tell otherwise
+DEFAULT_LIMITS = {
+    'secondly': 2,
+    'hourly': 1200,
+}
+PERIODS = {
+    'secondly': 1.0,
+    'hourly': 3600.0,
+}
+# Share of each bucket low priority requests can't use
+LOW_PRIORITY_RESERVE = {
+    'secondly': 0.5,
+    'hourly': 0.1,
+}
+
+STATE_FILE = 'intra_ratelimit.json'
+
+_priority = contextvars.ContextVar('intra_priority', default=PRIORITY_LIVE)
+
+
+@contextmanager
+def intra_priority(priority: str):
+    """Run the Intra API requests of a block with the given priority."""
+    reset_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset_token)
+
+
+def priority_context() -> contextvars.Context:
+    """New context carrying only the current Intra priority (for tasks on the Intra event loop)."""
+    context = contextvars.Context()
+    context.run(_priority.set, _priority.get())
+    return context
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class SharedRateLimiter:
+    def __init__(self, state_dir: str = None):
+        self._state_dir = state_dir
+
+    @property
+    def state_dir(self) -> str:
+        return self._state_dir or settings.INTRA_STATE_DIR
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.state_dir, STATE_FILE)
+
+    # # # Shared state (blocking: called through asyncio.to_thread) # # #
+
+    def _update(self, func):
+        """Run func(state, now) on the shared state under an exclusive flock and save it."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), 'r+') as f:
+                try:
+                    state = json.load(f)
+                except ValueError:
+                    state = {}
+                now = time.time()
+                self._refill(state, now)
+                result = func(state, now)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+            return result
+        finally:
+            os.close(fd)  # releases the flock
+
+    @staticmethod
+    def _refill(state, now):
+        for name, period in PERIODS.items():
+            bucket = state.get(name)
+            if not isinstance(bucket, dict):
+                limit = DEFAULT_LIMITS[name]
+                bucket = state[name] = {'limit': limit, 'tokens': float(limit), 'updated': now}
+            elapsed = max(0.0, now - bucket['updated'])
+            bucket['tokens'] = min(float(bucket['limit']), bucket['tokens'] + elapsed * bucket['limit'] / period)
+            bucket['updated'] = now
+
+    @staticmethod
+    def _take(state, now, priority) -> float:
+        """Take one token from each bucket, or return the seconds to wait before trying again."""
+        blocked_until = state.get('blocked_until', 0.0)
+        if blocked_until > now:
+            return blocked_until - now
+
+        wait = 0.0
+        for name, period in PERIODS.items():
+            bucket = state[name]
+            needed = 1.0
+            if priority == PRIORITY_LOW:
+                needed += bucket['limit'] * LOW_PRIORITY_RESERVE[name]
+            if bucket['tokens'] < needed:
+                wait = max(wait, (needed - bucket['tokens']) * period / bucket['limit'])
+        if wait:
+            return wait
+        for name in PERIODS:
+            state[name]['tokens'] -= 1.0
+        return 0.0
+
+    @staticmethod
+    def _sync(state, now, limits: dict, remaining: dict, retry_after: float | None):
+        for name in PERIODS:
+            bucket = state[name]
+            if limits.get(name):
+                bucket['limit'] = limits[name]
+            if remaining.get(name) is not None:
+                # The server count includes the requests of every process: never have more tokens than it says
+                bucket['tokens'] = min(bucket['tokens'], float(remaining[name]))
+        if retry_after is not None:
+            state['blocked_until'] = max(state.get('blocked_until', 0.0), now + retry_after)
+            state['secondly']['tokens'] = 0.0
+
+    # # # Async API # # #
+
+    async def acquire(self, priority: str = None) -> bool:
+        """
+        Wait for a token. Returns False (the request must not be sent) when it would
+        wait longer than MAX_WAIT for its priority.
+        """
+        priority = priority or _priority.get()
+        deadline = time.monotonic() + MAX_WAIT.get(priority, MAX_WAIT[PRIORITY_LIVE])
+        while True:
+            try:
+                wait = await asyncio.to_thread(self._update, lambda state, now: self._take(state, now, priority))
+            except OSError:
+                # State file unusable: don't block the requests, Intra will answer 429 if needed
+                return True
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    async def observe(self, headers, status_code: int = None):
+        """Correct the buckets from a response's rate limit headers (and Retry-After on a 429)."""
+        limits = {
+            'secondly': _header_int(headers, 'X-Secondly-RateLimit-Limit'),
+            'hourly': _header_int(headers, 'X-Hourly-RateLimit-Limit'),
+        }
+        remaining = {
+            'secondly': _header_int(headers, 'X-Secondly-RateLimit-Remaining'),
+            'hourly': _header_int(headers, 'X-Hourly-RateLimit-Remaining'),
+        }
+        retry_after = None
+        if status_code == 429:
+            try:
+                retry_after = float(headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = 1.0
+        if not any(limits.values()) and all(v is None for v in remaining.values()) and retry_after is None:
+            return
+        try:
+            await asyncio.to_thread(self._update, lambda state, now: self._sync(state, now, limits, remaining, retry_after))
+        except OSError:
+            pass
@@ -0,0 +1,411 @@
+import itertools, json, math, random, re, secrets, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .intra_breaker import endpoint_family
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Local Intra API stand-in (manage.py intra_standin)
+#
+# Fake api.intra.42.fr for benchmarks and tests of the reward code paths that
+# SIMULATION skips: AsyncIntraAPI points at it with INTRA_API_URL. Implements
+# /oauth/token and the endpoints used by the builtins, with consistent fake
+# data, plus configurable latency, injected errors (5xx, dropped connections,
+# 401) and Intra-like rate limits (429 + X-*-RateLimit-* headers).
+# Calls are counted per endpoint: GET /_standin/stats, POST /_standin/reset.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Fake data: every user is in cursus 21 on campus 1, in one of these coalitions
+CURSUS_ID = 21
+CAMPUS_ID = 1
+COALITION_IDS = (101, 102, 103, 104)
+
+
+class Latency:
+    """
+    Latency distribution from a spec (milliseconds):
+    'const:50', 'uniform:20,200', 'lognormal:80,0.5' (median, sigma), 'exp:50' (mean)
+    """
+    KINDS = {'const': 1, 'uniform': 2, 'lognormal': 2, 'exp': 1}
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(':')
+        try:
+            values = [float(v) for v in params.split(',')] if params else []
+        except ValueError:
+            raise ValueError(f"Invalid latency parameters: '{spec}'")
+        if kind not in self.KINDS or len(values) != self.KINDS[kind] or any(v < 0 for v in values):
+            raise ValueError(f"Invalid latency '{spec}', expected const:MS, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA or exp:MEAN")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self) -> float:
+        """Seconds"""
+        if self.kind == 'const':
+            ms = self.values[0]
+        elif self.kind == 'uniform':
+            ms = random.uniform(*self.values)
+        elif self.kind == 'lognormal':
+            median, sigma = self.values
+            ms = random.lognormvariate(math.log(median), sigma) if median else 0.0
+        else:
+            ms = random.expovariate(1 / self.values[0]) if self.values[0] else 0.0
+        return ms / 1000
+
+
+class StandinConfig:
+    def __init__(self, latency: str = 'const:0', family_latency: dict = None, error_rate: float = 0.0,
+                 drop_rate: float = 0.0, unauthorized_rate: float = 0.0, secondly: int = 2, hourly: int = 1200,
+                 token_ttl: int = 7200):
+        self.latency = Latency(latency)
+        # endpoint family ('v2/coalitions') -> Latency
+        self.family_latency = {family: Latency(spec) for family, spec in (family_latency or {}).items()}
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.unauthorized_rate = unauthorized_rate
+        self.secondly = secondly
+        self.hourly = hourly
+        self.token_ttl = token_ttl
+
+    def latency_for(self, path: str) -> Latency:
+        return self.family_latency.get(endpoint_family(path), self.latency)
+
+
+class StandinState:
+    """Counters, issued tokens, rate limit windows and the groups_users records."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1000)
+        self.tokens = {}
+        # intra user id -> [groups_users records]
+        self.groups_users = {}
+        self.second = self.hour = None
+        self.second_count = self.hour_count = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.calls = {}
+            self.statuses = {}
+            self.injected = {'errors': 0, 'drops': 0, 'unauthorized': 0, 'rate_limited': 0}
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self.ids)
+
+    def count(self, route: str, status: int):
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def inject(self, kind: str):
+        with self.lock:
+            self.injected[kind] += 1
+
+    def take(self, config: StandinConfig) -> tuple[float | None, dict]:
+        """Count a request in the rate limit windows. Returns (Retry-After or None, rate limit headers)."""
+        now = time.time()
+        with self.lock:
+            second, hour = int(now), int(now // 3600)
+            if second != self.second:
+                self.second, self.second_count = second, 0
+            if hour != self.hour:
+                self.hour, self.hour_count = hour, 0
+            retry_after = None
+            if self.hour_count >= config.hourly:
+                retry_after = float(math.ceil((hour + 1) * 3600 - now))
+            elif self.second_count >= config.secondly:
+                retry_after = 1.0
+            else:
+                self.second_count += 1
+                self.hour_count += 1
+            headers = {
+                'X-Secondly-RateLimit-Limit': config.secondly,
+                'X-Secondly-RateLimit-Remaining': max(0, config.secondly - self.second_count),
+                'X-Hourly-RateLimit-Limit': config.hourly,
+                'X-Hourly-RateLimit-Remaining': max(0, config.hourly - self.hour_count),
+            }
+            return retry_after, headers
+
+    def issue_token(self, ttl: int) -> dict:
+        token = secrets.token_hex(32)
+        with self.lock:
+            self.tokens[token] = time.time() + ttl
+        return {
+            'access_token': token,
+            'token_type': 'bearer',
+            'expires_in': ttl,
+            'scope': 'public profile tig',
+            'created_at': int(time.time()),
+        }
+
+    def token_valid(self, token: str) -> bool:
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def revoke_token(self, token: str):
+        with self.lock:
+            self.tokens.pop(token, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'uptime': round(time.time() - self.started, 3),
+                'total': sum(self.calls.values()),
+                'calls': dict(sorted(self.calls.items())),
+                'statuses': dict(sorted(self.statuses.items())),
+                'injected': dict(self.injected),
+            }
+
+
+# # # Fake endpoints: (method, path regex, route name) -> handler(state, match, form) -> (status, body) # # #
+
+def _form_value(form: dict, name: str, default=None):
+    values = form.get(name)
+    return values[0] if values else default
+
+
+def _int(value, default=0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _coalition_id(user_id: int) -> int:
+    return COALITION_IDS[user_id % len(COALITION_IDS)]
+
+
+def _user(state, match, form):
+    user_id = int(match['id'])
+    return 200, {
+        'id': user_id,
+        'login': f"user{user_id}",
+        'campus_users': [{'id': user_id, 'user_id': user_id, 'campus_id': CAMPUS_ID, 'is_primary': True}],
+        'cursus_users': [{'id': user_id, 'end_at': None, 'cursus_id': CURSUS_ID, 'cursus': {'id': CURSUS_ID, 'name': '42cursus', 'kind': 'main'}}],
+    }
+
+
+def _user_coalitions(state, match, form):
+    coalition_id = _coalition_id(int(match['id']))
+    return 200, [{'id': coalition_id, 'name': f"Coalition {coalition_id}", 'slug': f"coalition-{coalition_id}", 'score': 0, 'user_id': 1}]
+
+
+def _user_coalitions_users(state, match, form):
+    user_id = int(match['id'])
+    return 200, [{'id': user_id * 10, 'coalition_id': _coalition_id(user_id), 'user_id': user_id, 'score': 0, 'rank': 1}]
+
+
+def _blocs(state, match, form):
+    return 200, [{
+        'id': 1,
+        'campus_id': CAMPUS_ID,
+        'cursus_id': CURSUS_ID,
+        'coalitions': [{'id': coalition_id, 'name': f"Coalition {coalition_id}"} for coalition_id in COALITION_IDS],
+    }]
+
+
+def _score(state, match, form):
+    return 201, {
+        'id': state.next_id(),
+        'coalition_id': int(match['coalition_id']),
+        'coalitions_user_id': _int(_form_value(form, 'score[coalitions_user_id]'), None),
+        'value': _int(_form_value(form, 'score[value]')),
+        'reason': _form_value(form, 'score[reason]', ''),
+    }
+
+
+def _transaction(state, match, form):
+    return 201, {
+        'id': state.next_id(),
+        'value': _int(_form_value(form, 'transaction[value]')),
+        'user_id': _int(_form_value(form, 'transaction[user_id]')),
+        'transactable_type': _form_value(form, 'transaction[transactable_type]', ''),
+        'reason': _form_value(form, 'transaction[reason]', ''),
+    }
+
+
+def _titles_user(state, match, form):
+    return 201, {
+        'id': state.next_id(),
+        'title_id': _int(_form_value(form, 'titles_user[title_id]')),
+        'user_id': _int(_form_value(form, 'titles_user[user_id]')),
+        'selected': False,
+    }
+
+
+def _user_groups_users(state, match, form):
+    with state.lock:
+        return 200, list(state.groups_users.get(int(match['id']), []))
+
+
+def _create_groups_user(state, match, form):
+    user_id = _int(_form_value(form, 'groups_user[user_id]'))
+    group_id = _int(_form_value(form, 'groups_user[group_id]'))
+    record = {'id': state.next_id(), 'user_id': user_id, 'group': {'id': group_id, 'name': f"Group {group_id}"}}
+    with state.lock:
+        state.groups_users.setdefault(user_id, []).append(record)
+    return 201, record
+
+
+def _delete_groups_user(state, match, form):
+    record_id = int(match['id'])
+    with state.lock:
+        for records in state.groups_users.values():
+            for record in records:
+                if record['id'] == record_id:
+                    records.remove(record)
+                    return 204, None
+    return 404, {}
+
+
+def _close(state, match, form):
+    user_id = int(match['id'])
+    return 201, {
+        'id': state.next_id(),
+        'user': {'id': user_id},
+        'closer': {'id': _int(_form_value(form, 'close[closer_id]'), user_id)},
+        'kind': _form_value(form, 'close[kind]', 'other'),
+        'reason': _form_value(form, 'close[reason]', ''),
+        'state': 'close',
+    }
+
+
+def _community_service(state, match, form):
+    return 201, {
+        'id': state.next_id(),
+        'close': {'id': _int(_form_value(form, 'community_service[close_id]'))},
+        'duration': _int(_form_value(form, 'community_service[duration]')),
+        'occupation': _form_value(form, 'community_service[occupation]', ''),
+        'state': 'schedule',
+    }
+
+
+def _deleted(state, match, form):
+    return 204, None
+
+
+ROUTES = [
+    ('GET', r'/v2/users/(?P<id>\d+)', 'GET /v2/users/:id', _user),
+    ('GET', r'/v2/users/(?P<id>\d+)/coalitions', 'GET /v2/users/:id/coalitions', _user_coalitions),
+    ('GET', r'/v2/users/(?P<id>\d+)/coalitions_users', 'GET /v2/users/:id/coalitions_users', _user_coalitions_users),
+    ('GET', r'/v2/blocs', 'GET /v2/blocs', _blocs),
+    ('POST', r'/v2/coalitions/(?P<coalition_id>\d+)/scores', 'POST /v2/coalitions/:id/scores', _score),
+    ('DELETE', r'/v2/coalitions/(?P<coalition_id>\d+)/scores/(?P<id>\d+)', 'DELETE /v2/coalitions/:id/scores/:id', _deleted),
+    ('POST', r'/v2/transactions', 'POST /v2/transactions', _transaction),
+    ('DELETE', r'/v2/transactions/(?P<id>\d+)', 'DELETE /v2/transactions/:id', _deleted),
+    ('POST', r'/v2/titles_users', 'POST /v2/titles_users', _titles_user),
+    ('DELETE', r'/v2/titles_users/(?P<id>\d+)', 'DELETE /v2/titles_users/:id', _deleted),
+    ('GET', r'/v2/users/(?P<id>\d+)/groups_users', 'GET /v2/users/:id/groups_users', _user_groups_users),
+    ('POST', r'/v2/groups_users', 'POST /v2/groups_users', _create_groups_user),
+    ('DELETE', r'/v2/groups_users/(?P<id>\d+)', 'DELETE /v2/groups_users/:id', _delete_groups_user),
+    ('POST', r'/v2/users/(?P<id>\d+)/closes', 'POST /v2/users/:id/closes', _close),
+    ('DELETE', r'/v2/closes/(?P<id>\d+)', 'DELETE /v2/closes/:id', _deleted),
+    ('POST', r'/v2/community_services', 'POST /v2/community_services', _community_service),
+    ('DELETE', r'/v2/community_services/(?P<id>\d+)', 'DELETE /v2/community_services/:id', _deleted),
+]
+ROUTES = [(method, re.compile(pattern), name, handler) for method, pattern, name, handler in ROUTES]
+
+
+def _route(method: str, path: str):
+    for route_method, pattern, name, handler in ROUTES:
+        if route_method == method:
+            match = pattern.fullmatch(path)
+            if match:
+                return name, handler, match
+    return f"{method} (unknown)", None, None
+
+
+# # # HTTP server # # #
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    server_version = 'IntraStandin'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body=None, headers: dict = None):
+        payload = b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        state, config = self.server.state, self.server.config
+        path = urlsplit(self.path).path.rstrip('/') or '/'
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        form = parse_qs(raw.decode(errors='replace')) if raw else {}
+
+        # Control endpoints (not counted, no latency)
+        if path == '/_standin/stats' and self.command == 'GET':
+            return self._send(200, state.stats())
+        if path == '/_standin/reset' and self.command == 'POST':
+            state.reset()
+            return self._send(200, state.stats())
+
+        time.sleep(config.latency_for(path).sample())
+
+        if path == '/oauth/token' and self.command == 'POST':
+            state.count('POST /oauth/token', 200)
+            return self._send(200, state.issue_token(config.token_ttl))
+
+        route, handler, match = _route(self.command, path)
+
+        # Authentication: tokens issued by this server, not expired
+        token = (self.headers.get('Authorization') or '').removeprefix('Bearer ').strip()
+        if not state.token_valid(token):
+            state.count(route, 401)
+            return self._send(401, {'error': 'Not authorized', 'message': 'The access token is invalid'})
+        if random.random() < config.unauthorized_rate:
+            state.revoke_token(token)
+            state.inject('unauthorized')
+            state.count(route, 401)
+            return self._send(401, {'error': 'Not authorized', 'message': 'The access token expired'})
+
+        retry_after, headers = state.take(config)
+        if retry_after is not None:
+            state.inject('rate_limited')
+            state.count(route, 429)
+            return self._send(429, {'error': 'Too Many Requests'}, {**headers, 'Retry-After': int(math.ceil(retry_after))})
+
+        if random.random() < config.drop_rate:
+            # No response at all: a network error for the client
+            state.inject('drops')
+            state.count(route, 0)
+            self.close_connection = True
+            return
+        if random.random() < config.error_rate:
+            status = random.choice((500, 502, 503))
+            state.inject('errors')
+            state.count(route, status)
+            return self._send(status, {'error': 'Injected error'}, headers)
+
+        if handler is None:
+            state.count(route, 404)
+            return self._send(404, {'error': 'Not Found'}, headers)
+        status, body = handler(state, match, form)
+        state.count(route, status)
+        return self._send(status, body, headers)
+
+    do_GET = do_POST = do_DELETE = do_PATCH = do_PUT = _handle
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: StandinConfig, verbose: bool = False):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.state = StandinState()
+        self.verbose = verbose
@@ -0,0 +1,128 @@
+import asyncio, fcntl, json, os, time
+
+from django.conf import settings
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Shared Intra OAuth token
+#
+# The client-credentials token is stored in a file (INTRA_STATE_DIR), shared by
+# every process of the container (daphne workers, reward worker) and kept
+# across restarts. Refreshes are serialized with an exclusive flock on a side
+# lock file: one process fetches a new token, the others wait for it and read
+# it from the file instead of calling /oauth/token themselves.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# A token is refreshed this many seconds before it expires. Until then the
+# current one is served, so only one process refreshes (the others don't wait).
+REFRESH_AHEAD = 120
+# Never serve a token expiring in less than this many seconds
+EXPIRY_MARGIN = 10
+
+TOKEN_FILE = 'intra_token.json'
+
+
+class SharedTokenStore:
+    def __init__(self, state_dir: str = None):
+        self._state_dir = state_dir
+
+    @property
+    def state_dir(self) -> str:
+        return self._state_dir or settings.INTRA_STATE_DIR
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.state_dir, TOKEN_FILE)
+
+    # # # File access (blocking: called through asyncio.to_thread) # # #
+
+    def read(self) -> dict | None:
+        """Stored {'token': ..., 'expires_at': ...}, or None if missing/corrupted."""
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or 'token' not in entry or 'expires_at' not in entry:
+            return None
+        return entry
+
+    def write(self, token: dict, expires_at: float):
+        """Replace the stored token atomically (readers never see a partial file)."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'expires_at': expires_at}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self, access_token: str):
+        """Forget the stored token, only if it is still the given one (another process may have refreshed it)."""
+        entry = self.read()
+        if entry and entry['token'].get('access_token') == access_token:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def lock(self, blocking: bool = True):
+        """Open the lock file and take the exclusive refresh lock. Returns the fd, or None if not blocking and busy."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def unlock(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    # # # Async API # # #
+
+    async def get(self, fetch, current: dict | None = None) -> dict:
+        """
+        Return a valid {'token', 'expires_at'} entry, refreshing it with `await fetch()` if needed.
+        fetch() must return (token, expires_in).
+        current: entry already held by the caller, checked before reading the file.
+        """
+        now = time.time()
+        if current is None or current['expires_at'] - REFRESH_AHEAD <= now:
+            current = await asyncio.to_thread(self.read) or current
+        if current and current['expires_at'] - REFRESH_AHEAD > now:
+            return current
+
+        if current and current['expires_at'] - EXPIRY_MARGIN > now:
+            # Still valid: refresh ahead only if nobody else is doing it
+            fd = await asyncio.to_thread(self.lock, False)
+            if fd is None:
+                return current
+        else:
+            fd = await asyncio.to_thread(self.lock)
+
+        try:
+            # The process holding the lock before us may have refreshed it already
+            stored = await asyncio.to_thread(self.read)
+            if stored and stored['expires_at'] - REFRESH_AHEAD > time.time():
+                return stored
+            try:
+                token, expires_in = await fetch()
+            except Exception:
+                if current and current['expires_at'] - EXPIRY_MARGIN > time.time():
+                    return current
+                raise
+            entry = {'token': token, 'expires_at': time.time() + expires_in - EXPIRY_MARGIN}
+            await asyncio.to_thread(self.write, token, entry['expires_at'])
+            return entry
+        finally:
+            await asyncio.to_thread(self.unlock, fd)
+
+    async def invalidate(self, access_token: str):
+        """Drop a token rejected by the API (401), unless it was already replaced."""
+        fd = await asyncio.to_thread(self.lock)
+        try:
+            await asyncio.to_thread(self.clear, access_token)
+        finally:
+            await asyncio.to_thread(self.unlock, fd)
@@ -1,9 +1,9 @@
-import importlib, logging, queue, os
+import importlib, inspect, logging, queue, os
 from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from django.conf import settings
 
-from api.intra import intra_api
+from api.intra import intra_api, async_intra_api, run_in_intra_loop
 from .jackpot_logging import logger
 
 def _parse_function(function):
@@ -60,11 +60,37 @@ def _parse_function(function):
     return func, cancel_func  # Return functions objects
 
 
+# Resolved (func, cancel_func) pairs by function path, filled when wheels are loaded
+_resolved_functions: dict[str, tuple] = {}
+
+def resolve_function(function):
+    """
+    Return the (func, cancel_func) pair for a function path.
+    Resolved once with _parse_function, then served from memory.
+    Raises: Exception if invalid
+    """
+    pair = _resolved_functions.get(function)
+    if pair is None:
+        pair = _parse_function(function)
+        _resolved_functions[function] = pair
+    return pair
+
+def _call(func, user, args) -> tuple[bool, str, dict]:
+    """
+    Call a reward/cancel function.
+    Sync functions get the sync IntraAPI wrapper; `async def` ones get the
+    AsyncIntraAPI and run on the Intra event loop thread (they can gather requests).
+    """
+    if inspect.iscoroutinefunction(func):
+        return run_in_intra_loop(func, async_intra_api, user, args)
+    return func(intra_api, user, args)
+
+
 
 def handle_jackpots(user, jackpot) -> tuple[bool, str, dict]:
     """
     Handle jackpots and choose the route.
-    Called by wheel.views.spin
+    Called by wheel.outbox.process_entry
 
     Args:
         user: User instance
@@ -92,8 +118,8 @@ def handle_jackpots(user, jackpot) -> tuple[bool, str, dict]:
         return True, msg, {"simulation": True, "function": jackpot['function'], "args": jackpot.get('args', {})}
 
     try:
-        func, cancel_func = _parse_function(jackpot['function'])
-        success, msg, data = func(intra_api, user, jackpot.get('args', {}))
+        func, cancel_func = resolve_function(jackpot['function'])
+        success, msg, data = _call(func, user, jackpot.get('args', {}))
 
         if not success:
             #handle failure (if failure come from intra api, response contains the error details)
@@ -138,8 +164,8 @@ def cancel_jackpot(user: object, function_name: str, r_data: dict) -> tuple[bool
         return True, msg, {"simulation": True}
 
     try:
-        func, cancel_func = _parse_function(function_name)
-        success, msg, data = cancel_func(intra_api, user, r_data)
+        func, cancel_func = resolve_function(function_name)
+        success, msg, data = _call(cancel_func, user, r_data)
 
         if not success:
             #handle failure (if failure come from intra api, response contains the error details)
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.intra_standin import StandinConfig, StandinServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in of the Intra API (point INTRA_API_URL at it) with latency, error and 429 injection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Listen address (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8042, help='Listen port (default: 8042)')
+        parser.add_argument('--latency', default='const:0', help="Latency of every endpoint: const:MS, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA or exp:MEAN (default: const:0)")
+        parser.add_argument('--family-latency', action='append', default=[], metavar='FAMILY=SPEC', help="Latency of one endpoint family, e.g. v2/coalitions=lognormal:300,0.5 (repeatable)")
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 5xx (default: 0)')
+        parser.add_argument('--drop-rate', type=float, default=0.0, help='Share of requests left without response, closing the connection (default: 0)')
+        parser.add_argument('--unauthorized-rate', type=float, default=0.0, help='Share of requests answered 401, revoking their token (default: 0)')
+        parser.add_argument('--secondly', type=int, default=2, help='Requests per second before a 429 (default: 2, like an Intra application)')
+        parser.add_argument('--hourly', type=int, default=1200, help='Requests per hour before a 429 (default: 1200)')
+        parser.add_argument('--token-ttl', type=int, default=7200, help='Lifetime of the issued tokens in seconds (default: 7200)')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        family_latency = {}
+        for item in options['family_latency']:
+            family, sep, spec = item.partition('=')
+            if not sep:
+                raise CommandError(f"Invalid --family-latency '{item}', expected FAMILY=SPEC")
+            family_latency[family.strip('/')] = spec
+        for name in ('error_rate', 'drop_rate', 'unauthorized_rate'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be between 0 and 1")
+        if options['secondly'] < 1 or options['hourly'] < 1 or options['token_ttl'] < 1:
+            raise CommandError("--secondly, --hourly and --token-ttl must be positive")
+
+        try:
+            config = StandinConfig(
+                latency=options['latency'],
+                family_latency=family_latency,
+                error_rate=options['error_rate'],
+                drop_rate=options['drop_rate'],
+                unauthorized_rate=options['unauthorized_rate'],
+                secondly=options['secondly'],
+                hourly=options['hourly'],
+                token_ttl=options['token_ttl'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        server = StandinServer((options['host'], options['port']), config, verbose=options['verbose'])
+        url = f"http://{options['host']}:{server.server_address[1]}"
+        self.stdout.write(self.style.SUCCESS(f"Intra API stand-in listening on {url}"))
+        self.stdout.write(f"  backend:  INTRA_API_URL={url}")
+        self.stdout.write(f"  counts:   GET {url}/_standin/stats, POST {url}/_standin/reset")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(json.dumps(server.state.stats(), indent=2))
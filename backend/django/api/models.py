@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 # Add your models here.
 
@@ -17,3 +19,34 @@ class UniqueGroupOwner(models.Model):
 
     def __str__(self):
         return f"Group {self.group_id} owned by User {self.owner_user_id}"
+
+
+class CoalitionMembershipManager(models.Manager):
+    def store(self, user, coalition_id: int, coalitions_user_id: int = None, campus_id: int = None):
+        membership, _ = self.update_or_create(
+            user=user,
+            defaults={
+                'coalition_id': coalition_id,
+                'coalitions_user_id': coalitions_user_id,
+                'campus_id': campus_id,
+                'refreshed_at': timezone.now(),
+            }
+        )
+        return membership
+
+
+class CoalitionMembership(models.Model):
+    """
+    Primary coalition of a user as resolved by builtins.coa_points (profile + blocs + coalitions_users),
+    so most coalition spins only send the score POST. Dropped when Intra rejects it (see coa_points).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='coalition_membership')
+    coalition_id = models.IntegerField()
+    coalitions_user_id = models.IntegerField(null=True, blank=True)
+    campus_id = models.IntegerField(null=True, blank=True)
+    refreshed_at = models.DateTimeField()
+
+    objects = CoalitionMembershipManager()
+
+    def __str__(self):
+        return f"User {self.user_id} in coalition {self.coalition_id}"
@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os, sys
 
-from .utils import docker_secret, load_wheels, build_wheel_versions
+from .utils import docker_secret
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -56,7 +56,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'ft_wheel.middleware.AsyncWhiteNoiseMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'users.middleware.ConsentMiddleware',
     'users.middleware.MaintenanceMiddleware',
@@ -204,9 +204,13 @@ CSRF_TRUSTED_ORIGINS = [
 X_FRAME_OPTIONS = "DENY"
 
 WHEEL_CONFIGS_DIR = os.path.join(BASE_DIR, 'data/wheel_configs')
-# Single source of truth: WHEEL_CONFIGS contains {slug: {title, sectors, url}}
-WHEEL_CONFIGS = load_wheels(WHEEL_CONFIGS_DIR)
-WHEEL_VERSION_IDS = build_wheel_versions(WHEEL_CONFIGS)
+# Wheels are served by wheel.registry (reloaded from this directory when files change)
+
+# Runtime state shared by the processes of the container (Intra OAuth token, see api/intra_token.py)
+INTRA_STATE_DIR = os.environ.get('INTRA_STATE_DIR', '/tmp/ft_wheel')
+
+# Base URL of the Intra API (and of its /oauth/token), e.g. a local stand-in (manage.py intra_standin)
+INTRA_API_URL = os.environ.get('INTRA_API_URL', 'https://api.intra.42.fr').rstrip('/')
 
 HTTPS = os.environ.get('HTTPS', 'False') == 'True'
 
@@ -1,4 +1,6 @@
-import os, json, uuid
+import os, json, hashlib, logging, secrets
+
+logger = logging.getLogger('backend')
 
 def docker_secret(secret_name: str):
     secret_file = os.path.join("/run/secrets", secret_name)
@@ -11,8 +13,126 @@ def docker_secret(secret_name: str):
         raise Exception(f"Can't read secret '{secret_name}': {e}")
 
 
-def load_wheels(wheel_configs_dir: str):
-    """Load wheel configurations and return format: {slug: {title, sectors, url}}
+class CompiledSector:
+    """One wheel sector, its reward function path validated at load time."""
+    __slots__ = ('label', 'color', 'message', 'function', 'args')
+
+    def __init__(self, label, color, message, function, args):
+        self.label = label
+        self.color = color
+        self.message = message
+        self.function = function
+        self.args = args
+
+    def as_dict(self) -> dict:
+        """Full sector definition (as stored in the wheel config file)."""
+        return {
+            'label': self.label,
+            'color': self.color,
+            'message': self.message,
+            'function': self.function,
+            'args': self.args,
+        }
+
+    def client_payload(self) -> dict:
+        """Only what the client is allowed to see."""
+        return {'label': self.label, 'color': self.color, 'message': self.message}
+
+
+class CompiledWheel:
+    """A loaded wheel configuration, ready to be served and spun.
+
+    Sectors are stored once each (definitions) and the wheel itself is a
+    run-length layout of (definition index, weight) segments, so memory and
+    page payload grow with the number of distinct sectors, not the total weight.
+    Segments are drawn with an alias table: O(1) per spin, backed by secrets.
+    """
+    __slots__ = ('slug', 'title', 'url', 'ticket_only', 'definitions', 'layout', 'total_weight',
+                 'client_sectors', 'client_layout', '_alias_prob', '_alias_idx')
+
+    def __init__(self, slug, title, ticket_only, definitions, layout):
+        self.slug = slug
+        self.title = title
+        self.url = slug
+        self.ticket_only = ticket_only
+        self.definitions = tuple(definitions)
+        self.layout = tuple(layout)
+        self.total_weight = sum(weight for _, weight in self.layout)
+        self.client_sectors = [sector.client_payload() for sector in self.definitions]
+        self.client_layout = [[def_idx, weight] for def_idx, weight in self.layout]
+        self._build_alias_table()
+
+    def _build_alias_table(self):
+        """Vose alias method on integers: segment i is drawn with probability weight_i / total_weight exactly."""
+        n = len(self.layout)
+        total = self.total_weight
+        # Column i is kept if randbelow(total) < prob[i], else its alias is used
+        scaled = [weight * n for _, weight in self.layout]
+        prob = [total] * n
+        alias = list(range(n))
+        small = [i for i, w in enumerate(scaled) if w < total]
+        large = [i for i, w in enumerate(scaled) if w >= total]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] += scaled[s] - total
+            (small if scaled[l] < total else large).append(l)
+        self._alias_prob = tuple(prob)
+        self._alias_idx = tuple(alias)
+
+    def draw(self) -> int:
+        """Draw a segment index (position in layout)."""
+        column = secrets.randbelow(len(self.layout))
+        if secrets.randbelow(self.total_weight) < self._alias_prob[column]:
+            return column
+        return self._alias_idx[column]
+
+    def sector_at(self, index: int) -> CompiledSector:
+        """Sector definition of the segment at this layout position."""
+        return self.definitions[self.layout[index][0]]
+
+    def expanded_sectors(self):
+        """Yield one sector per weight unit, in wheel order (admin editor format)."""
+        for def_idx, weight in self.layout:
+            sector = self.definitions[def_idx]
+            for _ in range(weight):
+                yield sector
+
+
+def _compile_sector(raw: dict) -> CompiledSector:
+    """Validate a sector definition and its reward functions. Raises ValueError if invalid.
+    resolve_function keeps what it resolves (per process): handle_jackpots and cancel_jackpot
+    look the functions up by name there."""
+    # Lazy import: reward modules need the apps to be loaded
+    from api.jackpots_handler import resolve_function
+
+    if not isinstance(raw, dict):
+        raise ValueError(f"Sector must be an object, got {type(raw).__name__}")
+    label = raw.get('label')
+    if not label or not isinstance(label, str):
+        raise ValueError("Sector is missing its label")
+    function = raw.get('function') or 'builtins.default'
+    if not isinstance(function, str):
+        raise ValueError(f"Sector '{label}': function must be a string")
+    args = raw.get('args') or {}
+    if not isinstance(args, dict):
+        raise ValueError(f"Sector '{label}': args must be an object")
+    try:
+        resolve_function(function)
+    except Exception as e:
+        raise ValueError(f"Sector '{label}': {e}")
+    return CompiledSector(
+        label=label,
+        color=raw.get('color') or '#FFFFFF',
+        message=raw.get('message') or 'You won... something?',
+        function=function,
+        args=args,
+    )
+
+
+def compile_wheel(data: dict, default_slug: str) -> CompiledWheel:
+    """Build a CompiledWheel from a wheel config file content. Raises ValueError if invalid.
 
     Fields in sectors:
     - label <string> - identifier/name of the sector
@@ -21,57 +141,106 @@ def load_wheels(wheel_configs_dir: str):
     - message <string> (default: "You won... something?") - message to show when landed on this sector  
     - function <string> (default: builtins.default) - function to call when landed on this sector
     - args <dict> (default: {}) - arguments to pass to the function
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Wheel configuration must be a JSON object")
+    slug_raw = data.get('url') or data.get('slug') or default_slug
+    slug_norm = slug_raw.lower().replace(' ', '_')
+    title = data.get('title') or slug_norm.capitalize()
+    ticket_only = bool(data.get('ticket_only', False))
+
+    definitions = []
+    def_indexes = {}
+    layout = []
+
+    def add(sector, weight):
+        """Register the sector definition once and append (or extend) its segment."""
+        key = (sector.label, sector.color, sector.message, sector.function,
+               json.dumps(sector.args, sort_keys=True, default=str))
+        def_idx = def_indexes.get(key)
+        if def_idx is None:
+            def_idx = def_indexes[key] = len(definitions)
+            definitions.append(sector)
+        if weight <= 0:
+            return
+        if layout and layout[-1][0] == def_idx:
+            layout[-1] = (def_idx, layout[-1][1] + weight)
+        else:
+            layout.append((def_idx, weight))
+
+    # Support both jackpots and sequence formats
+    if 'sequence' in data and isinstance(data['sequence'], list):
+        # Direct sequence format
+        for raw in data['sequence']:
+            add(_compile_sector(raw), 1)
+    else:
+        # Legacy jackpots format
+        jackpots = data.get('jackpots', {})
+        if not isinstance(jackpots, dict):
+            raise ValueError("'jackpots' must be an object")
+        for k, v in jackpots.items():
+            if not isinstance(v, dict):
+                raise ValueError(f"Jackpot '{k}' must be an object")
+            number = v.get('number', 1)
+            if not isinstance(number, int) or isinstance(number, bool) or number < 0:
+                raise ValueError(f"Jackpot '{k}': number must be a positive integer")
+            add(_compile_sector({**v, 'label': k}), number)
+
+    return CompiledWheel(slug_norm, title, ticket_only, definitions, layout)
+
+
+def is_wheel_config_file(fname: str) -> bool:
+    return fname.startswith('jackpots_') and fname.endswith('.json')
+
+
+def load_wheel_file(path: str):
+    """Load and compile one wheel configuration file. Returns a CompiledWheel, or None if unreadable/rejected.
 
-    This will be used as the single WHEEL_CONFIGS source."""
+    Reward functions are resolved here: a wheel pointing to a missing/invalid
+    function is rejected (and logged) instead of failing at spin time."""
+    fname = os.path.basename(path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    try:
+        return compile_wheel(data, fname[len('jackpots_'):-5])
+    except ValueError as e:
+        logger.error(f"Wheel config '{fname}' rejected: {e}")
+        return None
+
+
+def load_wheels(wheel_configs_dir: str):
+    """Load and compile all wheel configurations and return format: {slug: CompiledWheel}
+    (served through wheel.registry, which only reloads changed files)."""
     wheels = {}
     if not os.path.isdir(wheel_configs_dir):
         return wheels
-    for fname in os.listdir(wheel_configs_dir):
-        if not fname.startswith('jackpots_') or not fname.endswith('.json'):
+    for fname in sorted(os.listdir(wheel_configs_dir)):
+        if not is_wheel_config_file(fname):
             continue
-        path = os.path.join(wheel_configs_dir, fname)
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except Exception:
-            continue
-        slug_raw = data.get('url') or data.get('slug') or fname[len('jackpots_'):-5]
-        slug_norm = slug_raw.lower().replace(' ', '_')
-        title = data.get('title') or slug_norm.capitalize()
-        ticket_only = bool(data.get('ticket_only', False))
-
-        # Support both jackpots and sequence formats
-        if 'sequence' in data and isinstance(data['sequence'], list):
-            # Direct sequence format
-            sectors = data['sequence']
-        else:
-            # Legacy jackpots format
-            jackpots = data.get('jackpots', {})
-            sectors = [
-                {
-                    "label": k,
-                    "color": v.get("color") or "#FFFFFF",
-                    "message": v.get("message") or "You won... something?",
-                    "function": v.get("function") or "builtins.default",
-                    "args": v.get("args") or {},
-                }
-                for k, v in jackpots.items()
-                for _ in range(v.get('number', 1))
-            ]
-
-        wheels[slug_norm] = {
-            'title': title,
-            'sectors': sectors,
-            'url': slug_norm,
-            'ticket_only': ticket_only,
-        }
+        wheel = load_wheel_file(os.path.join(wheel_configs_dir, fname))
+        if wheel is not None:
+            wheels[wheel.slug] = wheel
     return wheels
 
 
+def wheel_content_hash(wheel: CompiledWheel) -> str:
+    """Stable hash of what a client of this wheel sees (sectors, layout, ticket-only flag).
+    Same value in every worker process and across restarts; reward functions/args are not part of it."""
+    payload = json.dumps(
+        {'sectors': wheel.client_sectors, 'layout': wheel.client_layout, 'ticket_only': wheel.ticket_only},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
 def build_wheel_versions(wheel_configs: dict):
-    """Generate a unique ID per wheel configuration."""
-    rebuild_time = uuid.uuid4().hex[:12]
+    """Generate a version ID per wheel configuration.
+    Derived from the wheel content: it only changes when that wheel changes for clients,
+    so editing one wheel does not make clients of the other wheels outdated."""
     versions = {}
-    for slug in wheel_configs.keys():
-        versions[slug] = f"{slug}_{rebuild_time}"
+    for slug, wheel in wheel_configs.items():
+        versions[slug] = f"{slug}_{wheel_content_hash(wheel)[:12]}"
     return versions
@@ -0,0 +1,120 @@
+// History page: global and personal feeds, loaded page by page from /api/history/ (infinite scroll)
+
+document.addEventListener('DOMContentLoaded', function() {
+    const feeds = {
+        all: createFeed('all', document.getElementById('global-history')),
+        mine: createFeed('mine', document.getElementById('my-history')),
+    };
+    feeds.all.loadMore();
+
+    document.getElementById('show-global-history').addEventListener('click', function() {
+        showFeed(feeds, 'all', this, document.getElementById('show-my-history'));
+    });
+    document.getElementById('show-my-history').addEventListener('click', function() {
+        showFeed(feeds, 'mine', this, document.getElementById('show-global-history'));
+    });
+});
+
+function showFeed(feeds, scope, button, otherButton) {
+    Object.entries(feeds).forEach(([name, feed]) => {
+        feed.container.style.display = name === scope ? 'flex' : 'none';
+    });
+    // Enable css "selected" effect
+    button.classList.add('history-selected');
+    otherButton.classList.remove('history-selected');
+    if (!feeds[scope].started) feeds[scope].loadMore();
+}
+
+function createFeed(scope, container) {
+    const sentinel = document.createElement('div');
+    sentinel.className = 'history-sentinel';
+    container.appendChild(sentinel);
+
+    const feed = {
+        container: container,
+        started: false,
+        loading: false,
+        next: null,
+        done: false,
+        async loadMore() {
+            if (this.loading || this.done) return;
+            this.loading = true;
+            this.started = true;
+            try {
+                const params = new URLSearchParams({ scope: scope });
+                if (this.next) params.set('cursor', this.next);
+                const response = await fetch(`/api/history/?${params}`, { credentials: 'same-origin' });
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const page = await response.json();
+                page.entries.forEach(entry => container.insertBefore(renderEntry(entry, scope), sentinel));
+                this.next = page.next;
+                this.done = !page.next;
+                if (this.done && !container.querySelector('.history-entry')) {
+                    const empty = document.createElement('p');
+                    empty.className = 'nohistory';
+                    empty.textContent = 'No history entries found.';
+                    container.insertBefore(empty, sentinel);
+                }
+            } catch (error) {
+                console.error('Error while loading history:', error);
+            } finally {
+                this.loading = false;
+            }
+            // Page shorter than the container: keep loading
+            if (!this.done && isVisible(sentinel, container)) this.loadMore();
+        },
+    };
+
+    new IntersectionObserver(entries => {
+        if (entries.some(e => e.isIntersecting) && feed.started) feed.loadMore();
+    }, { root: container, rootMargin: '200px' }).observe(sentinel);
+    return feed;
+}
+
+function isVisible(element, container) {
+    return container.style.display !== 'none'
+        && element.getBoundingClientRect().top <= container.getBoundingClientRect().bottom + 200;
+}
+
+function renderEntry(entry, scope) {
+    const el = document.createElement('div');
+    el.className = 'history-entry';
+    el.id = `entry-${entry.id}`;
+    el.style.background = hexToRgba(entry.color, 0.2);
+
+    el.appendChild(field('Date:', new Date(entry.ts).toLocaleString(), 'date'));
+    if (scope === 'all') {
+        const user = document.createElement('a');
+        user.className = 'history-user-p';
+        user.href = `https://profile.intra.42.fr/users/${encodeURIComponent(entry.login)}`;
+        const strong = document.createElement('strong');
+        strong.textContent = entry.login;
+        user.appendChild(strong);
+        el.appendChild(user);
+    } else {
+        el.appendChild(field('Mode:', (entry.wheel || '').toUpperCase()));
+    }
+    el.appendChild(field('Reward:', (entry.details || '').toUpperCase(), 'gain'));
+    return el;
+}
+
+function field(label, value, id) {
+    const p = document.createElement('p');
+    if (id) p.id = id;
+    const strong = document.createElement('strong');
+    strong.textContent = label;
+    p.appendChild(strong);
+    p.appendChild(document.createTextNode(` ${value}`));
+    return p;
+}
+
+// Convert hex to rgba with the given alpha
+function hexToRgba(hex, alpha) {
+    let c = (hex || '#FFFFFF').replace('#', '');
+    if (c.length === 3) c = c.split('').map(x => x + x).join('');
+    const num = parseInt(c, 16);
+    const r = (num >> 16) & 255;
+    const g = (num >> 8) & 255;
+    const b = num & 255;
+    return `rgba(${r},${g},${b},${alpha})`;
+}
@@ -190,6 +190,9 @@ function displayHistoryDetails(data, highlightSection = null) {
     if (data.is_cancelled) {
         statusDisplay = 'CANCELLED';
         statusClass = 'status-cancelled';
+    } else if (data.is_pending) {
+        statusDisplay = 'PENDING';
+        statusClass = 'status-pending';
     } else if (data.success === false) {
         statusDisplay = 'ERROR';
         statusClass = 'status-error';
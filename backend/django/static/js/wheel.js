@@ -63,12 +63,29 @@ if (!Array.isArray(sectors)) {
 }
 window.sectors = sectors; // ensure canonical
 
+// Wheel layout: [[sector index, weight], ...] in wheel order.
+// A sector of weight N covers N / totalWeight of the wheel (same odds as N repeated slices).
+let layout = Array.isArray(window.layout) ? window.layout : sectors.map((_, i) => [i, 1]);
+let segments = [];
+
+// Build segments {sector, start, weight} (start/weight in weight units)
+const buildSegments = () => {
+    let start = 0;
+    segments = [];
+    layout.forEach(([defIdx, weight]) => {
+        segments.push({ sector: sectors[defIdx], start, weight });
+        start += weight;
+    });
+    window.segments = segments;
+    return start;
+};
+
 // Generate random float in range min-max:
 const rand = (m, M) => Math.random() * (M - m) + m;
 // Fix negative modulo stackoverflow.com/a/71167019/383904
 const mod = (n, m) => (n % m + m) % m;
 
-window.tot = sectors.length;
+window.tot = buildSegments(); // total weight
 window.elSpin = document.querySelector("#spin");
 window.elWheel = document.querySelector("#wheel");
 window.ctx = elWheel.getContext`2d`;
@@ -80,7 +97,7 @@ ctx.canvas.height = dia;
 window.rad = dia / 2;
 window.PI = Math.PI;
 window.TAU = 2 * PI;
-window.arc = TAU / tot;
+window.arc = TAU / tot; // angle of one weight unit
 window.angOffset = TAU * 0.75; // needle is north
 
 window.sectorIndex = 0; // Current sector index
@@ -91,10 +108,18 @@ window.spinAnimation = null;
 window.animationFrameId = null;
 
 
-//* Get index of current sector */
+//* Get index of current segment */
 window.getIndex = (ang) => {
     // Adapt for the orientation of the wheel (starting point)
-    return (tot - Math.floor(mod(ang, TAU) / TAU * tot) - 1) % tot;
+    const unit = (tot - Math.floor(mod(ang, TAU) / TAU * tot) - 1) % tot;
+    // Binary search the segment covering this weight unit
+    let lo = 0, hi = segments.length - 1;
+    while (lo < hi) {
+        const mid = (lo + hi + 1) >> 1;
+        if (segments[mid].start <= unit) lo = mid;
+        else hi = mid - 1;
+    }
+    return lo;
 };
 
 const tickSound = new Audio('/static/sounds/tick.mp3');
@@ -117,12 +142,13 @@ document.addEventListener('wheelConfigChanged', (e) => {
     // If an external script updated window.sectors, rebind local sectors
     if (Array.isArray(window.sectors)) {
         sectors = window.sectors;
+        layout = Array.isArray(window.layout) ? window.layout : sectors.map((_, i) => [i, 1]);
     }
-    window.tot = sectors.length;
+    window.tot = buildSegments();
     window.arc = TAU / tot;
     
     ctx.clearRect(0, 0, dia, dia);
-    sectors.forEach(drawSector);
+    segments.forEach(drawSegment);
     
     ang = 0;
     oldAng = 0;
@@ -158,16 +184,17 @@ const showWinPopup = (message) => {
 }
 
 
-//* Draw sectors and prizes texts to canvas */
-const drawSector = (sector, i) => {
-    const ang = arc * i;
+//* Draw segments and prizes texts to canvas */
+const drawSegment = ({ sector, start, weight }) => {
+    const ang = arc * start;
+    const span = arc * weight;
     ctx.save();
 
     // COLOR
     ctx.beginPath();
     ctx.fillStyle = sector.color;
     ctx.moveTo(rad, rad);
-    ctx.arc(rad, rad, rad, ang - 0.003, ang + arc + 0.003);
+    ctx.arc(rad, rad, rad, ang - 0.003, ang + span + 0.003);
     ctx.lineTo(rad, rad);
     ctx.fill();
 
@@ -178,7 +205,7 @@ const drawSector = (sector, i) => {
 
     // TEXT
     ctx.translate(rad, rad);
-    ctx.rotate(ang + arc / 2);
+    ctx.rotate(ang + span / 2);
     ctx.textAlign = "right";
     ctx.fillStyle = "#fff";
     ctx.font = `bold 2rem sans-serif`;
@@ -221,17 +248,17 @@ const update = () => {
 
 
 const spin = (index, duration) => {
-    const nindex = index; 
+    const { start, weight } = segments[index];
 
     // Absolute current angle (without turns)
     oldAng = ang;
     const angAbs = mod(ang, TAU);
 
     // Absolute new angle - adaptation to orientation
-    let angNew = arc * (tot - nindex - 1); // Here we adapt the formula for orientation
+    let angNew = arc * (tot - start - weight); // Here we adapt the formula for orientation
     
     // (backtrack a bit to not end on the exact edge)
-    angNew += rand(0, arc * 0.7);
+    angNew += rand(0, arc * weight * 0.7);
 
     // Fix negative angles
     angNew = mod(angNew, TAU);
@@ -251,7 +278,7 @@ const spin = (index, duration) => {
     });
 
     spinAnimation.addEventListener("finish", () => {
-        showWinPopup(sectors[index].message);
+        showWinPopup(segments[index].sector.message);
         spinAnimation = null;
         update();
     }, { once: true });
@@ -334,7 +361,7 @@ elSpin.addEventListener("click", async () => {
             // Sync local version id (should be same). If different just sync.
             window.CURRENT_WHEEL_VERSION_ID = result.wheel_version_id;
         }
-        if (targetIndex >= 0 && targetIndex < sectors.length) {
+        if (targetIndex >= 0 && targetIndex < segments.length) {
             spin(targetIndex);
         } else {
             console.error("Invalid sector index:", targetIndex);
@@ -349,5 +376,5 @@ window._spinListenerAdded = true;
 
 
 // INIT!
-sectors.forEach(drawSector);
+segments.forEach(drawSegment);
 update();
\ No newline at end of file
@@ -2,24 +2,25 @@ from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.http import HttpResponse
 from django.template import loader
-from administration.models import SiteSettings
+from administration.site_settings import get_site_settings, aget_site_settings
 from django.conf import settings as django_settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 
 class ConsentMiddleware:
     """
     Middleware to handle user acknowledge of TIG, and others bad things.
     Redirects to a consent page if the user has not given consent.
+    Sync and async capable, so async views (spin_view) are not forced through the sync thread.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
-        if django_settings.ASK_CONSENT is False:
-            # Consent not required, proceed normally
-            response = self.get_response(request)
-            return response
-
+    def _must_consent(self, request, user):
         excluded_routes = [
             reverse('consent'),
             reverse('accept_consent'),
@@ -28,61 +29,96 @@ class ConsentMiddleware:
             reverse('callback'),
             '/static/',
         ]
-
         # Check if the user is authenticated and has not given consent
-        if request.user.is_authenticated:
-            if not request.user.has_consent and request.path not in excluded_routes:
-                return redirect(reverse('consent'))
-            
+        return user.is_authenticated and not user.has_consent and request.path not in excluded_routes
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if django_settings.ASK_CONSENT is False:
+            # Consent not required, proceed normally
+            response = self.get_response(request)
+            return response
+
+        if self._must_consent(request, request.user):
+            return redirect(reverse('consent'))
 
         response = self.get_response(request)
         return response
 
+    async def __acall__(self, request):
+        if django_settings.ASK_CONSENT is not False:
+            if self._must_consent(request, await request.auser()):
+                return redirect(reverse('consent'))
+        return await self.get_response(request)
+
 
 
 class MaintenanceMiddleware:
     """
     Middleware to handle maintenance mode.
     Shows maintenance page to non-admin users when maintenance mode is enabled.
+    Sync and async capable, like ConsentMiddleware.
     """
+    sync_capable = True
+    async_capable = True
+
+    # Routes still served during maintenance
+    excluded_routes = [
+        '/static/',
+        '/login',
+        '/logout',
+    ]
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _is_excluded(self, request):
+        # Check if route should be excluded from maintenance
+        return any(request.path.startswith(excluded) for excluded in self.excluded_routes)
+
+    def _maintenance_response(self, request, settings):
+        # Show maintenance page to all other users
+        template = loader.get_template('maintenance.html')
+        context = {
+            'maintenance_message': settings.maintenance_message,
+        }
+        return HttpResponse(template.render(context, request), status=503)
 
     def __call__(self, request):
-        # Import here to avoid circular imports
-        try:
-            settings = SiteSettings.objects.get(pk=1)
-            if not settings.maintenance_mode:
-                # Maintenance mode is disabled, proceed normally
-                response = self.get_response(request)
-                return response
-        except SiteSettings.DoesNotExist:
-            # No settings found, proceed normally
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        # Served from the in-process snapshot: no query on most requests
+        settings = get_site_settings()
+        if not settings.maintenance_mode:
+            # Maintenance mode is disabled, proceed normally
             response = self.get_response(request)
             return response
 
         # Maintenance mode is enabled
-        excluded_routes = [
-            '/static/',
-            '/login',
-            '/logout',
-        ]
-
         # Allow admins to access the site normally during maintenance
         if request.user.is_authenticated and request.user.has_perm('bypass_maintenance'):
             response = self.get_response(request)
             return response
 
-        # Check if route should be excluded from maintenance
-        for excluded in excluded_routes:
-            if request.path.startswith(excluded):
-                response = self.get_response(request)
-                return response
+        if self._is_excluded(request):
+            response = self.get_response(request)
+            return response
 
-        # Show maintenance page to all other users
-        template = loader.get_template('maintenance.html')
-        context = {
-            'maintenance_message': settings.maintenance_message,
-        }
-        return HttpResponse(template.render(context, request), status=503)
\ No newline at end of file
+        return self._maintenance_response(request, settings)
+
+    async def __acall__(self, request):
+        settings = await aget_site_settings()
+        if not settings.maintenance_mode:
+            return await self.get_response(request)
+
+        user = await request.auser()
+        if (user.is_authenticated and user.has_perm('bypass_maintenance')) or self._is_excluded(request):
+            return await self.get_response(request)
+
+        # Template context processors may hit the database: render in the sync thread
+        return await sync_to_async(self._maintenance_response)(request, settings)
@@ -1,13 +1,32 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models, transaction
+from django.db import models, transaction, connection
 from django.utils import timezone
 from django.apps import apps
 from datetime import timedelta
 import secrets, base64
 from administration.models import SiteSettings
-from django.db.models import Q
+from administration.site_settings import get_site_settings, aget_site_settings
+from django.db.models import Q, Value, Subquery, DurationField, ExpressionWrapper
+from django.db.models.functions import Coalesce
 from django.utils import timezone as dj_tz
 
+def _cooldown_threshold(spin_at):
+    """Latest last_spin that still allows a spin at spin_at.
+    On PostgreSQL the cooldown is read from SiteSettings inside the UPDATE itself
+    (no extra query, always the committed value); other backends can't multiply an
+    interval, so the cached snapshot is used.
+    """
+    if connection.vendor == 'postgresql':
+        cooldown_seconds = Coalesce(
+            Subquery(SiteSettings.objects.filter(pk=1).values('jackpot_cooldown')[:1]),
+            Value(86400),
+        )
+        cooldown = ExpressionWrapper(cooldown_seconds * Value(timedelta(seconds=1)), output_field=DurationField())
+        return ExpressionWrapper(Value(spin_at) - cooldown, output_field=models.DateTimeField())
+    cooldown_seconds = get_site_settings().jackpot_cooldown
+    return spin_at - timedelta(seconds=cooldown_seconds)
+
+
 # Create your models here.
 class AccountManager(BaseUserManager):
     def create_user(self, login, **extra_fields):
@@ -104,14 +123,8 @@ class Account(AbstractBaseUser):
         return ['wheel', 'users'].__contains__(app_label)
     
     def time_to_spin(self):
-        # Get cooldown from site settings
-        try:
-            settings = SiteSettings.objects.get(pk=1)
-            cooldown_seconds = settings.jackpot_cooldown
-        except (ImportError, SiteSettings.DoesNotExist):
-            # Fallback to 24 hours if settings not available
-            cooldown_seconds = 86400
-        
+        # Get cooldown from site settings (in-process snapshot, defaults if the row is missing)
+        cooldown_seconds = get_site_settings().jackpot_cooldown
         cooldown_delta = timedelta(seconds=cooldown_seconds)
         
         if not self.last_spin:
@@ -125,32 +138,56 @@ class Account(AbstractBaseUser):
         
         return time_to_spin
 
+    async def atime_to_spin(self):
+        """Async version of time_to_spin (only reads the database when the settings snapshot is stale)."""
+        cooldown_delta = timedelta(seconds=(await aget_site_settings()).jackpot_cooldown)
+        if not self.last_spin:
+            return timedelta(0)
+        time_since_last_spin = timezone.now() - self.last_spin
+        if time_since_last_spin >= cooldown_delta:
+            return timedelta(0)
+        return cooldown_delta - time_since_last_spin
+
+    def claim_spin(self, spin_at) -> bool:
+        """Claim a cooldown spin with one conditional UPDATE (no SELECT FOR UPDATE).
+
+        last_spin is set to spin_at only if the cooldown has elapsed. Returns
+        False if still on cooldown: in that case the row is not updated, hence
+        not locked.
+        """
+        claimed = Account.objects.filter(pk=self.pk).filter(
+            Q(last_spin__isnull=True) | Q(last_spin__lte=_cooldown_threshold(spin_at))
+        ).update(last_spin=spin_at)
+        if claimed:
+            self.last_spin = spin_at
+        return bool(claimed)
+
     def has_ticket(self, wheel_slug: str) -> bool:
         if not wheel_slug:
             return False
         # Lazy import to avoid circular import at app load
-        Ticket = apps.get_model('wheel', 'Ticket')
-        return Ticket.objects.filter(user=self, wheel_slug=wheel_slug, used_at__isnull=True).exists()
+        TicketBalance = apps.get_model('wheel', 'TicketBalance')
+        return TicketBalance.objects.unused_count(self, wheel_slug) > 0
 
-    def consume_ticket(self, wheel_slug: str) -> bool:
-        """Consume one unused ticket for this wheel. Returns True if consumed."""
+    async def ahas_ticket(self, wheel_slug: str) -> bool:
         if not wheel_slug:
             return False
+        TicketBalance = apps.get_model('wheel', 'TicketBalance')
+        return await TicketBalance.objects.aunused_count(self, wheel_slug) > 0
+
+    def consume_ticket(self, wheel_slug: str):
+        """Consume one unused ticket for this wheel. Returns the consumed ticket, or None."""
+        if not wheel_slug:
+            return None
         Ticket = apps.get_model('wheel', 'Ticket')
         with transaction.atomic():
-            ticket = Ticket.objects.select_for_update().filter(
-                user=self, wheel_slug=wheel_slug, used_at__isnull=True
-            ).order_by('created_at').first()
-            if not ticket:
-                return False
-            ticket.mark_used()
-            return True
+            return Ticket.objects.consume(self, wheel_slug)
 
     def tickets_count(self, wheel_slug: str) -> int:
         if not wheel_slug:
             return 0
-        Ticket = apps.get_model('wheel', 'Ticket')
-        return Ticket.objects.filter(user=self, wheel_slug=wheel_slug, used_at__isnull=True).count()
+        TicketBalance = apps.get_model('wheel', 'TicketBalance')
+        return TicketBalance.objects.unused_count(self, wheel_slug)
 
     def can_spin_wheel(self, wheel_slug: str, ticket_only: bool) -> bool:
         """New gate: if ticket_only -> must have unused ticket.
@@ -165,6 +202,16 @@ class Account(AbstractBaseUser):
             return False
         return True
 
+    async def acan_spin_wheel(self, wheel_slug: str, ticket_only: bool) -> bool:
+        """Async version of can_spin_wheel. Not a claim: the spin is still claimed in the transaction."""
+        if self.test_mode:
+            return True
+        if ticket_only:
+            return await self.ahas_ticket(wheel_slug)
+        if await self.atime_to_spin() > timedelta(0):
+            return False
+        return True
+
 
 
 class OauthStateManager(models.Manager):
@@ -208,3 +255,63 @@ class OauthState(models.Model):
         return f"{self.state}"
     
     objects = OauthStateManager()
+
+
+
+class IntraProfileManager(models.Manager):
+    def store(self, user, user_data: dict = None, coalitions: list = None):
+        """
+        Save the slice of an Intra user (/v2/me or /v2/users/:id) used by rewards,
+        and/or the user's coalitions (/v2/users/:id/coalitions). Missing parts are kept.
+        """
+        defaults = {}
+        if user_data is not None:
+            defaults['refreshed_at'] = timezone.now()
+            defaults['campus_id'] = IntraProfile.primary_campus_id(user_data)
+            defaults['cursus_users'] = [
+                {
+                    'cursus': {'id': (cu.get('cursus') or {}).get('id'), 'kind': (cu.get('cursus') or {}).get('kind')},
+                    'end_at': cu.get('end_at'),
+                }
+                for cu in user_data.get('cursus_users') or [] if isinstance(cu, dict)
+            ]
+        if coalitions is not None:
+            defaults['coalitions'] = [
+                {'id': c.get('id'), 'name': c.get('name'), 'slug': c.get('slug')}
+                for c in coalitions if isinstance(c, dict)
+            ]
+            defaults['coalitions_refreshed_at'] = timezone.now()
+        profile, _ = self.update_or_create(user=user, defaults=defaults)
+        return profile
+
+
+class IntraProfile(models.Model):
+    """
+    Intra data of a user needed by rewards (primary campus, cursus, coalitions),
+    saved at login and refreshed in the background when stale (see api/intra_profile.py).
+    """
+    user = models.OneToOneField(Account, on_delete=models.CASCADE, primary_key=True, related_name='intra_profile')
+    campus_id = models.IntegerField(null=True, blank=True)
+    # [{'cursus': {'id': 21, 'kind': 'main'}, 'end_at': None}, ...]
+    cursus_users = models.JSONField(default=list, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    # [{'id': 334, 'name': 'Technicians', 'slug': 'technicians'}, ...], None until fetched once
+    coalitions = models.JSONField(null=True, blank=True)
+    coalitions_refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = IntraProfileManager()
+
+    def __str__(self):
+        return f"Intra profile of {self.user_id}"
+
+    @staticmethod
+    def primary_campus_id(user_data: dict):
+        for campus in user_data.get('campus_users') or []:
+            if isinstance(campus, dict) and campus.get('is_primary'):
+                return campus.get('campus_id')
+        return None
+
+    def as_user_data(self) -> dict:
+        """Same shape as the parts of /v2/users/:id read by builtins."""
+        campus_users = [{'campus_id': self.campus_id, 'is_primary': True}] if self.campus_id else []
+        return {'campus_users': campus_users, 'cursus_users': self.cursus_users}
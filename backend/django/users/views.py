@@ -7,7 +7,7 @@ from django.conf import settings
 import logging, requests, json, secrets
 from django.db import IntegrityError, transaction
 from ft_wheel.utils import docker_secret
-from .models import OauthStateManager, OauthState
+from .models import OauthStateManager, OauthState, IntraProfile
 
 User = get_user_model()
 OauthStateManager = OauthState.objects
@@ -103,6 +103,12 @@ def callback_view(request):
 		if created:
 			user.save()
 
+		# Keep the profile slice used by rewards (campus, cursus): spins don't fetch it again
+		try:
+			IntraProfile.objects.store(user, user_data=user_data)
+		except Exception as e:
+			logger.error(f"Failed to store Intra profile of {user.login}: {e}")
+
 		login(request, user, backend='django.contrib.auth.backends.ModelBackend')
 	except requests.exceptions.RequestException as e:
 		oauth_state.delete()
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class WheelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wheel'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (TicketBalance sync)
+        from .search import install_search_indexes
+
+        # pg_trgm and the history search indexes (see wheel/search.py)
+        post_migrate.connect(install_search_indexes, sender=self)
+
+        # Wheels are compiled here and not in settings.py: resolving reward
+        # functions imports modules that need the models to be loaded.
+        from .registry import wheel_registry
+
+        wheel_registry.refresh()
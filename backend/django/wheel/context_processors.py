@@ -1,18 +1,19 @@
-from django.conf import settings
+from .registry import wheel_registry
 
 def wheel_list(request):
     """Expose available wheels with slug & title (and version id) to all templates as WHEEL_LIST.
     Also expose flags about user (role info / testmode) for JS consumption.
     """
     wheels_meta = []
-    wheel_store = getattr(settings, 'WHEEL_CONFIGS', {})
-    version_ids = getattr(settings, 'WHEEL_VERSION_IDS', {})
-    for slug, data in wheel_store.items():
+    snapshot = wheel_registry.snapshot()
+    wheel_store = snapshot.wheels
+    version_ids = snapshot.versions
+    for slug, wheel in wheel_store.items():
         wheels_meta.append({
             'slug': slug,
-            'title': data.get('title', slug),
+            'title': wheel.title,
             'version_id': version_ids.get(slug),
-            'ticket_only': bool(data.get('ticket_only', False)),
+            'ticket_only': wheel.ticket_only,
         })
     # sort by title for consistency
     wheels_meta.sort(key=lambda x: x['title'].lower())
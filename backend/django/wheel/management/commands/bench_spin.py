@@ -0,0 +1,243 @@
+import asyncio, secrets, statistics, threading, time
+from importlib import import_module
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+from users.models import Account
+from wheel.models import Ticket, TicketBalance
+from wheel.registry import wheel_registry, get_wheels
+
+BENCH_LOGIN_PREFIX = 'bench_'
+
+
+class QueryCounter:
+    """Counts queries and their time on every DB connection of the process
+    (the ASGI app runs its sync code in other threads, each with its own connection)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.seconds = 0.0
+        self.enabled = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if self.enabled:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.queries += 1
+                    self.seconds += elapsed
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def reset(self):
+        with self.lock:
+            self.queries = 0
+            self.seconds = 0.0
+
+
+class LockWaitSampler(threading.Thread):
+    """PostgreSQL only: samples pg_stat_activity for backends waiting on a lock.
+    Lock wait time is estimated as (waiting backends per sample) x (sampling interval)."""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.waiting_seconds = 0.0
+        self.max_waiting = 0
+
+    def run(self):
+        try:
+            # Own connection of this thread: QueryCounter installs itself on it when it
+            # opens, and the sampler's polls must not count as spin queries
+            connection.ensure_connection()
+            connection.execute_wrappers.clear()
+            with connection.cursor() as cursor:
+                while not self.stop_event.is_set():
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    waiting = cursor.fetchone()[0]
+                    self.waiting_seconds += waiting * self.interval
+                    self.max_waiting = max(self.max_waiting, waiting)
+                    time.sleep(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the spin path: concurrent POST /spin/ from simulated accounts through the ASGI app (SIMULATION mode only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Simulated accounts (default: 50)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight (default: 20)')
+        parser.add_argument('--spins', type=int, default=2, help='Spins per account and wheel; past the first, cooldown spins are refused (default: 2)')
+        parser.add_argument('--tickets', type=int, default=1, help='Tickets granted per account on ticket-only wheels (default: 1)')
+        parser.add_argument('--wheel', action='append', dest='wheels', help='Wheel slug to benchmark (repeatable). Default: one cooldown wheel and one ticket-only wheel')
+        parser.add_argument('--keep', action='store_true', help='Keep the simulated accounts and their history afterwards')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'SIMULATION', False):
+            raise CommandError("bench_spin only runs with SIMULATION=True: spins must not reach the Intra API.")
+
+        wheels = self._pick_wheels(options['wheels'])
+        users = self._create_accounts(max(1, options['users']))
+        self.stdout.write(f"{len(users)} simulated accounts, wheels: {', '.join(wheels)}")
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING("SQLite allows a single writer: concurrent spins will fail with 'database is locked'. Benchmark against PostgreSQL."))
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        for conn in connections.all(initialized_only=True):
+            counter.install(connection=conn)
+
+        try:
+            for slug in wheels:
+                wheel = get_wheels()[slug]
+                if wheel.ticket_only:
+                    self._grant_tickets(users, slug, max(0, options['tickets']))
+                else:
+                    Account.objects.filter(pk__in=[u.pk for u in users]).update(last_spin=None)
+                cookies = self._create_sessions(users, slug)
+                result = self._run(slug, cookies, options, counter)
+                self._report(slug, wheel.ticket_only, result)
+        finally:
+            connection_created.disconnect(counter.install)
+            if not options['keep']:
+                Account.objects.filter(login__startswith=BENCH_LOGIN_PREFIX).delete()
+                self.stdout.write("Simulated accounts deleted")
+
+    def _pick_wheels(self, requested):
+        configs = get_wheels()
+        if requested:
+            unknown = [slug for slug in requested if slug not in configs]
+            if unknown:
+                raise CommandError(f"Unknown wheel(s): {', '.join(unknown)}")
+            return requested
+        cooldown = next((slug for slug, w in configs.items() if not w.ticket_only), None)
+        ticket = next((slug for slug, w in configs.items() if w.ticket_only), None)
+        wheels = [slug for slug in (cooldown, ticket) if slug]
+        if not wheels:
+            raise CommandError("No wheel configuration loaded.")
+        return wheels
+
+    def _create_accounts(self, count):
+        Account.objects.filter(login__startswith=BENCH_LOGIN_PREFIX).delete()
+        Account.objects.bulk_create([
+            Account(login=f"{BENCH_LOGIN_PREFIX}{i:05d}", intra_id=-(i + 1), has_consent=True)
+            for i in range(count)
+        ])
+        return list(Account.objects.filter(login__startswith=BENCH_LOGIN_PREFIX).order_by('login'))
+
+    def _grant_tickets(self, users, slug, per_user):
+        # bulk_create skips the TicketBalance signals: balances are written directly
+        Ticket.objects.filter(user__in=users, wheel_slug=slug).delete()
+        TicketBalance.objects.filter(user__in=users, wheel_slug=slug).delete()
+        Ticket.objects.bulk_create([Ticket(user=u, wheel_slug=slug) for u in users for _ in range(per_user)])
+        TicketBalance.objects.bulk_create([TicketBalance(user=u, wheel_slug=slug, unused_count=per_user) for u in users])
+
+    def _create_sessions(self, users, slug):
+        """Log the accounts in without OAuth: one session per account, on this wheel."""
+        SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+        cookies = []
+        for user in users:
+            session = SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session['wheel_config_type'] = slug
+            session.create()
+            cookies.append(session.session_key)
+        return cookies
+
+    def _run(self, slug, session_keys, options, counter):
+        from ft_wheel.asgi import application
+
+        version_id = wheel_registry.snapshot().versions.get(slug)
+        spins = max(1, options['spins'])
+        concurrency = max(1, options['concurrency'])
+        csrf_token = secrets.token_hex(16)
+
+        async def bench():
+            latencies = []
+            statuses = {}
+            semaphore = asyncio.Semaphore(concurrency)
+            transport = httpx.ASGITransport(app=application)
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                async def spin(session_key):
+                    async with semaphore:
+                        start = time.perf_counter()
+                        response = await client.post(
+                            '/spin/',
+                            json={'wheel_version_id': version_id},
+                            headers={
+                                'X-CSRFToken': csrf_token,
+                                'Cookie': f"{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}",
+                            },
+                        )
+                        latencies.append(time.perf_counter() - start)
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+                # Each round, every account spins once (concurrently with the others)
+                started = time.perf_counter()
+                for _ in range(spins):
+                    await asyncio.gather(*(spin(key) for key in session_keys))
+                elapsed = time.perf_counter() - started
+            return latencies, statuses, elapsed
+
+        sampler = LockWaitSampler() if connection.vendor == 'postgresql' else None
+        counter.reset()
+        counter.enabled = True
+        if sampler:
+            sampler.start()
+        try:
+            latencies, statuses, elapsed = asyncio.run(bench())
+        finally:
+            counter.enabled = False
+            if sampler:
+                sampler.stop()
+
+        return {
+            'latencies': latencies,
+            'statuses': statuses,
+            'elapsed': elapsed,
+            'queries': counter.queries,
+            'db_seconds': counter.seconds,
+            'lock_wait': sampler.waiting_seconds if sampler else None,
+            'max_waiting': sampler.max_waiting if sampler else None,
+        }
+
+    def _report(self, slug, ticket_only, result):
+        latencies = sorted(result['latencies'])
+        total = len(latencies)
+        if not total:
+            self.stdout.write(f"[{slug}] no request sent")
+            return
+        quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if total > 1 else latencies * 99
+        ms = lambda seconds: f"{seconds * 1000:.1f}ms"
+
+        self.stdout.write(self.style.SUCCESS(f"[{slug}] {'ticket-only' if ticket_only else 'cooldown'} wheel"))
+        self.stdout.write(f"  requests:     {total} in {result['elapsed']:.2f}s -> {total / result['elapsed']:.1f} req/s")
+        self.stdout.write(f"  statuses:     {', '.join(f'{code}: {n}' for code, n in sorted(result['statuses'].items()))}")
+        self.stdout.write(f"  latency:      p50 {ms(quantiles[49])}  p95 {ms(quantiles[94])}  p99 {ms(quantiles[98])}  max {ms(latencies[-1])}")
+        self.stdout.write(f"  queries:      {result['queries'] / total:.1f} per spin ({ms(result['db_seconds'] / total)} DB time per spin)")
+        if result['lock_wait'] is None:
+            self.stdout.write("  lock wait:    n/a (PostgreSQL only)")
+        else:
+            self.stdout.write(f"  lock wait:    ~{result['lock_wait']:.3f}s total (sampled), {ms(result['lock_wait'] / total)} per spin, max {result['max_waiting']} waiting backends")
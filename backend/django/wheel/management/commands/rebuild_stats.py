@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from wheel.models import History, DailyWheelStat, UserSpinTotal
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the /stats/ rollup tables (daily spins per wheel and sector, spins per user) from the history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-empty', action='store_true', help='Only if the rollups are empty and the history is not (first deployment)')
+
+    def handle(self, *args, **options):
+        if options['if_empty'] and (DailyWheelStat.objects.exists() or not History.objects.exists()):
+            self.stdout.write("Stats rollups already built")
+            return
+        days = DailyWheelStat.objects.rebuild()
+        users = UserSpinTotal.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Stats rebuilt ({days} day/wheel/sector rows, {users} users with spins)"))
@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from wheel.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Apply pending wheel rewards from the reward outbox to the Intra API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+        parser.add_argument('--batch-size', type=int, default=20, help='Entries claimed per batch (default: 20)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Rewards applied in parallel (default: 4)')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to wait when the outbox is empty (default: 0.5)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        interval = max(0.05, options['interval'])
+        self.stdout.write(f"Reward worker started (batch={batch_size} concurrency={options['concurrency']})")
+
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            while True:
+                try:
+                    processed = drain_outbox(batch_size, executor)
+                except Exception as e:
+                    self.stderr.write(f"Reward worker error: {e}")
+                    processed = 0
+                finally:
+                    close_old_connections()
+
+                if options['once'] and processed < batch_size:
+                    break
+                if processed == 0:
+                    time.sleep(interval)
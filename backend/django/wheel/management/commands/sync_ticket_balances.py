@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from wheel.models import TicketBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ticket balances (unused tickets per user and wheel) from the tickets table'
+
+    def handle(self, *args, **options):
+        count = TicketBalance.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Ticket balances rebuilt ({count} user/wheel pairs with unused tickets)"))
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F, Count, Q
+from django.db.models.functions import TruncDate
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
@@ -32,6 +34,7 @@ class History(models.Model):
     r_message = models.CharField(blank=True, null=True)  # message of intra response
     r_data = models.JSONField(blank=True, null=True)  # data of intra response
     success = models.BooleanField(default=True, help_text="Whether the jackpot execution was successful")
+    is_pending = models.BooleanField(default=False, help_text="Whether the reward is still waiting in the reward outbox")
     
     # Admin fields
     is_cancelled = models.BooleanField(default=False, help_text="Whether this entry has been cancelled")
@@ -53,13 +56,29 @@ class History(models.Model):
         """List of users who marked this entry"""
         return [mark.marked_by for mark in self.marks.all()]
     
+    @property
+    def counts_in_stats(self):
+        """Counted in the stats rollups: reward applied or still pending (failed spins were refunded)."""
+        return self.success or self.is_pending
+
     def can_be_cancelled(self):
         """Check if this history entry can be cancelled"""
-        return not self.is_cancelled and self.r_data is not None and self.success is True
+        return not self.is_cancelled and not self.is_pending and self.r_data is not None and self.success is True
     
     class Meta:
         ordering = ['-timestamp']
         verbose_name_plural = "Histories"
+        indexes = [
+            # Keyset pagination of the history feeds (wheel/views.py::history_api): global and per user.
+            # A page is a range scan reading `limit` rows from the table (plus the users join for scope=all).
+            # No INCLUDE columns: they would be written to both indexes on every spin.
+            models.Index(fields=['-timestamp', '-id'], name='history_feed_idx'),
+            models.Index(fields=['user', '-timestamp', '-id'], name='history_user_feed_idx'),
+        ]
+
+
+# History rows counted in the stats rollups (same rule as History.counts_in_stats)
+STATS_COUNTED = Q(success=True) | Q(is_pending=True)
 
 
 
@@ -68,7 +87,60 @@ class TicketManager(models.Manager):
         return self.filter(user=user, wheel_slug=wheel_slug, used_at__isnull=True)
 
     def count_unused(self, user, wheel_slug):
-        return self.unused_tickets(user, wheel_slug).count()
+        return TicketBalance.objects.unused_count(user, wheel_slug)
+
+    def consume(self, user, wheel_slug):
+        """Consume the oldest unused ticket of this user for this wheel. Returns the ticket, or None.
+
+        The balance row is decremented first: it is the gate, and serializes consumes of one user
+        on one wheel. The ticket itself is taken with a single UPDATE ... SKIP LOCKED RETURNING.
+        Must be called inside a transaction.
+        """
+        if not TicketBalance.objects.adjust(user.pk, wheel_slug, -1):
+            return None
+
+        now = timezone.now()
+        if connection.vendor == 'postgresql':
+            table = self.model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {table} SET used_at = %s
+                    WHERE id = (
+                        SELECT id FROM {table}
+                        WHERE user_id = %s AND wheel_slug = %s AND used_at IS NULL
+                        ORDER BY created_at
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, created_at, granted_by_id
+                    """,
+                    [now, user.pk, wheel_slug],
+                )
+                row = cursor.fetchone()
+            ticket = None
+            if row:
+                ticket = self.model(id=row[0], user=user, wheel_slug=wheel_slug, created_at=row[1], granted_by_id=row[2], used_at=now)
+        else:
+            # Other backends (sqlite in dev): plain ORM, the row count guards against double use
+            ticket = self.unused_tickets(user, wheel_slug).order_by('created_at').first()
+            if ticket and self.filter(pk=ticket.pk, used_at__isnull=True).update(used_at=now):
+                ticket.used_at = now
+            else:
+                ticket = None
+
+        if ticket is None:
+            # Balance was out of sync with the tickets: fix it
+            TicketBalance.objects.resync(user.pk, wheel_slug)
+        return ticket
+
+    def restore(self, ticket_id):
+        """Give back a consumed ticket (e.g. its reward failed). Returns True if it was restored."""
+        ticket = self.filter(pk=ticket_id, used_at__isnull=False).only('user_id', 'wheel_slug').first()
+        if not ticket or not self.filter(pk=ticket_id, used_at__isnull=False).update(used_at=None):
+            return False
+        TicketBalance.objects.adjust(ticket.user_id, ticket.wheel_slug, 1)
+        return True
 
 
 class Ticket(models.Model):
@@ -96,7 +168,204 @@ class Ticket(models.Model):
     def is_used(self) -> bool:
         return self.used_at is not None
 
+    objects = TicketManager()
+
     def mark_used(self):
         if not self.used_at:
             self.used_at = timezone.now()
-            self.save(update_fields=['used_at'])
\ No newline at end of file
+            self.save(update_fields=['used_at'])
+            TicketBalance.objects.adjust(self.user_id, self.wheel_slug, -1)
+
+
+class TicketBalanceManager(models.Manager):
+    def unused_count(self, user, wheel_slug) -> int:
+        if not wheel_slug:
+            return 0
+        balance = self.filter(user=user, wheel_slug=wheel_slug).values_list('unused_count', flat=True).first()
+        return balance or 0
+
+    async def aunused_count(self, user, wheel_slug) -> int:
+        if not wheel_slug:
+            return 0
+        balance = await self.filter(user=user, wheel_slug=wheel_slug).values_list('unused_count', flat=True).afirst()
+        return balance or 0
+
+    def adjust(self, user_id, wheel_slug, delta: int) -> bool:
+        """Add delta to the balance in one UPDATE. A decrement never goes below zero.
+        Returns False if nothing was changed (decrement on an empty balance)."""
+        qs = self.filter(user_id=user_id, wheel_slug=wheel_slug)
+        if delta < 0:
+            return bool(qs.filter(unused_count__gte=-delta).update(unused_count=F('unused_count') + delta))
+        if qs.update(unused_count=F('unused_count') + delta):
+            return True
+        self.get_or_create(user_id=user_id, wheel_slug=wheel_slug)
+        return bool(qs.update(unused_count=F('unused_count') + delta))
+
+    def resync(self, user_id, wheel_slug):
+        """Recompute one balance from the tickets."""
+        count = Ticket.objects.filter(user_id=user_id, wheel_slug=wheel_slug, used_at__isnull=True).count()
+        self.update_or_create(user_id=user_id, wheel_slug=wheel_slug, defaults={'unused_count': count})
+
+    def rebuild(self) -> int:
+        """Recompute every balance from the tickets. Returns the number of balances kept."""
+        counts = (
+            Ticket.objects.filter(used_at__isnull=True)
+            .values('user_id', 'wheel_slug')
+            .annotate(count=Count('id'))
+        )
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                self.model(user_id=row['user_id'], wheel_slug=row['wheel_slug'], unused_count=row['count'])
+                for row in counts
+            ])
+        return len(counts)
+
+
+class TicketBalance(models.Model):
+    """Unused tickets count per (user, wheel), kept in sync with Ticket.
+    Granting/deleting tickets is tracked by signals (wheel/signals.py), consuming/restoring by TicketManager.
+    Lets ticket gating and UI counts read one row instead of counting tickets.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ticket_balances')
+    wheel_slug = models.CharField(max_length=50)
+    unused_count = models.PositiveIntegerField(default=0)
+
+    objects = TicketBalanceManager()
+
+    class Meta:
+        unique_together = ['user', 'wheel_slug']
+
+    def __str__(self):
+        return f"TicketBalance[{self.wheel_slug}] {self.user_id}: {self.unused_count}"
+
+
+class DailyWheelStatManager(models.Manager):
+    def adjust(self, day, wheel: str, details: str, color: str, spins: int = 0, cancelled: int = 0) -> bool:
+        """Add to the counters of one (day, wheel, sector) row in one UPDATE, creating the row on an increment.
+        Returns False if nothing was changed."""
+        qs = self.filter(day=day, wheel=wheel, details=details or '', color=color)
+        # A decrement never goes below zero
+        if spins < 0:
+            qs = qs.filter(spins__gte=-spins)
+        if cancelled < 0:
+            qs = qs.filter(cancelled__gte=-cancelled)
+        changes = {'spins': F('spins') + spins, 'cancelled': F('cancelled') + cancelled}
+        if qs.update(**changes):
+            return True
+        if spins < 0 or cancelled < 0:
+            return False
+        self.get_or_create(day=day, wheel=wheel, details=details or '', color=color)
+        return bool(qs.update(**changes))
+
+    def record(self, history, spins: int = 0, cancelled: int = 0) -> bool:
+        return self.adjust(timezone.localdate(history.timestamp), history.wheel, history.details, history.color, spins, cancelled)
+
+    def rebuild(self) -> int:
+        """Recompute every row from the counted History entries (STATS_COUNTED). Returns the number of rows kept."""
+        rows = (
+            History.objects.filter(STATS_COUNTED).annotate(day=TruncDate('timestamp'))
+            .values('day', 'wheel', 'details', 'color')
+            .annotate(spins=Count('id'), cancelled=Count('id', filter=Q(is_cancelled=True)))
+            .order_by()
+        )
+        # NULL and '' details share the '' row
+        merged = {}
+        for row in rows:
+            key = (row['day'], row['wheel'], row['details'] or '', row['color'])
+            spins, cancelled = merged.get(key, (0, 0))
+            merged[key] = (spins + row['spins'], cancelled + row['cancelled'])
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                self.model(day=day, wheel=wheel, details=details, color=color, spins=spins, cancelled=cancelled)
+                for (day, wheel, details, color), (spins, cancelled) in merged.items()
+            ], batch_size=1000)
+        return len(merged)
+
+
+class DailyWheelStat(models.Model):
+    """Spins per (day, wheel, sector), kept in sync with History (wheel/signals.py, cancel_history_entry).
+    Lets /stats/ sum a few hundred rows instead of aggregating the whole history.
+    """
+    day = models.DateField()
+    wheel = models.CharField(max_length=50)
+    details = models.CharField(max_length=250, blank=True, default='')  # sector label ('' when History.details is NULL)
+    color = models.CharField(max_length=20, default='#FFFFFF')
+    spins = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    objects = DailyWheelStatManager()
+
+    class Meta:
+        unique_together = ['day', 'wheel', 'details', 'color']
+
+    def __str__(self):
+        return f"DailyWheelStat[{self.day} {self.wheel}] {self.details}: {self.spins}"
+
+
+class UserSpinTotalManager(models.Manager):
+    def adjust(self, user_id, delta: int) -> bool:
+        """Add delta to a user's total in one UPDATE. A decrement never goes below zero, nor creates
+        the row (e.g. the user is being deleted). Returns False if nothing was changed."""
+        qs = self.filter(user_id=user_id)
+        if delta < 0:
+            qs = qs.filter(spins__gte=-delta)
+        if qs.update(spins=F('spins') + delta):
+            return True
+        if delta < 0:
+            return False
+        self.get_or_create(user_id=user_id)
+        return bool(qs.update(spins=F('spins') + delta))
+
+    def rebuild(self) -> int:
+        """Recompute every total from the counted History entries (STATS_COUNTED). Returns the number of users with spins."""
+        counts = History.objects.filter(STATS_COUNTED).values('user_id').annotate(count=Count('id')).order_by()
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                self.model(user_id=row['user_id'], spins=row['count'])
+                for row in counts
+            ], batch_size=1000)
+        return len(counts)
+
+
+class UserSpinTotal(models.Model):
+    """Spins (cancelled included) per user, kept in sync with History (wheel/signals.py). Backs the leaderboard."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='spin_total')
+    spins = models.PositiveIntegerField(default=0)
+
+    objects = UserSpinTotalManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-spins']),
+        ]
+
+    def __str__(self):
+        return f"UserSpinTotal {self.user_id}: {self.spins}"
+
+
+class RewardOutbox(models.Model):
+    """Reward waiting to be applied to the Intra API by the reward worker (see wheel/outbox.py).
+    Created in the same transaction as its pending History entry, deleted once the reward is applied
+    or has definitively failed.
+    """
+    history = models.OneToOneField(History, on_delete=models.CASCADE, related_name='outbox')
+    function_name = models.CharField(max_length=100)
+    args = models.JSONField(default=dict, blank=True)
+
+    # What the spin consumed, given back if the reward definitively fails
+    consumed_ticket = models.ForeignKey(Ticket, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    claimed_spin_at = models.DateTimeField(null=True, blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+
+    def __str__(self):
+        return f"Outbox[{self.function_name}] history={self.history_id} attempts={self.attempts}"
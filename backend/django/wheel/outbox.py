@@ -0,0 +1,217 @@
+import ast, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+
+from api.jackpots_handler import handle_jackpots
+from users.models import Account
+from .models import History, RewardOutbox, Ticket, DailyWheelStat, UserSpinTotal
+
+logger = logging.getLogger('backend')
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Reward outbox
+#
+# spin_view only records the spin (cooldown/ticket, pending History entry and
+# an outbox row) and returns. The reward worker (manage.py reward_worker)
+# drains the outbox and applies rewards to the Intra API, so the Account row
+# lock and the spin request never wait on Intra.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# A claimed entry is hidden from other workers for this long. The lease is
+# renewed every LEASE_RENEWAL while its reward runs, so it only expires if the
+# worker dies: the entry is then claimed again and flagged for review.
+CLAIM_LEASE = timedelta(minutes=2)
+LEASE_RENEWAL = timedelta(seconds=30)
+# Rewards are not idempotent on Intra: an entry is applied at most once. A
+# failed reward refunds the spin, an interrupted one is left to an admin.
+MAX_ATTEMPTS = 1
+# Intra requests refused before being sent (open circuit breaker, rate limit):
+# the reward is deferred instead of failed, without counting an attempt,
+# for at most MAX_DEFERRAL after the spin.
+DEFERRED_ERRORS = ('CircuitOpen', 'RateLimited')
+DEFER_DELAY = timedelta(seconds=15)
+MAX_DEFERRAL = timedelta(minutes=30)
+
+
+def enqueue_reward(user, wheel: str, sector, consumed_ticket=None, claimed_spin_at=None) -> History:
+    """Record a pending History entry and its outbox row.
+    Must be called inside the spin transaction so both commit with the cooldown/ticket consumption.
+    """
+    history = History.objects.create(
+        wheel=wheel,
+        details=sector.label,
+        color=sector.color,
+        function_name=sector.function,
+        success=False,
+        is_pending=True,
+        user=user,
+    )
+    RewardOutbox.objects.create(
+        history=history,
+        function_name=sector.function,
+        args=sector.args,
+        consumed_ticket=consumed_ticket,
+        claimed_spin_at=claimed_spin_at,
+    )
+    return history
+
+
+def _normalize_data(data):
+    """Jackpot handlers return a dict, a ValueError wrapping the Intra error body or its repr."""
+    if type(data) is ValueError:
+        data = data.args[0]
+    elif type(data) is str:
+        data = ast.literal_eval(data)
+    elif type(data) is not dict:
+        raise ValueError("Unexpected data type from jackpot handler: %s" % type(data))
+    return data
+
+
+def _refund(entry: RewardOutbox):
+    """Give back what the spin consumed (ticket or cooldown)."""
+    if entry.consumed_ticket_id:
+        Ticket.objects.restore(entry.consumed_ticket_id)
+    if entry.claimed_spin_at:
+        # Only if the user did not spin again since
+        Account.objects.filter(pk=entry.history.user_id, last_spin=entry.claimed_spin_at).update(last_spin=None)
+
+
+def _uncount(history: History):
+    """Take a spin whose reward failed back out of the stats rollups (counted at insert, see wheel/signals.py)."""
+    DailyWheelStat.objects.record(history, spins=-1)
+    UserSpinTotal.objects.adjust(history.user_id, -1)
+
+
+def _should_defer(history: History, data) -> bool:
+    return (
+        isinstance(data, dict)
+        and data.get('error_kind') in DEFERRED_ERRORS
+        and timezone.now() - history.timestamp < MAX_DEFERRAL
+    )
+
+
+def claim_batch(batch_size: int) -> list[RewardOutbox]:
+    """Claim up to batch_size due entries. Entries claimed by another worker are skipped."""
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            RewardOutbox.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        for entry in entries:
+            entry.attempts += 1
+            entry.next_attempt_at = now + CLAIM_LEASE
+            entry.save(update_fields=['attempts', 'next_attempt_at'])
+    return entries
+
+
+def _renew_lease(entry: RewardOutbox, done: threading.Event):
+    """Push back the lease of a claimed entry until done is set.
+    Only our claim is renewed (same attempts count), never one taken over by another worker."""
+    try:
+        while not done.wait(LEASE_RENEWAL.total_seconds()):
+            RewardOutbox.objects.filter(pk=entry.pk, attempts=entry.attempts).update(
+                next_attempt_at=timezone.now() + CLAIM_LEASE
+            )
+    except Exception as e:
+        logger.error("Could not renew the lease of outbox entry %s: %s", entry.pk, e)
+    finally:
+        close_old_connections()
+
+
+def _apply_reward(entry: RewardOutbox, history: History):
+    """Run the reward function while keeping the entry's lease alive."""
+    jackpot = {'label': history.details, 'function': entry.function_name, 'args': entry.args}
+    done = threading.Event()
+    renewer = threading.Thread(target=_renew_lease, args=(entry, done), daemon=True)
+    renewer.start()
+    try:
+        success, message, data = handle_jackpots(history.user, jackpot)
+        data = _normalize_data(data)
+    except Exception as e:
+        logger.error("Unexpected error while handling jackpot for history %s: %s", history.id, e)
+        success, message, data = False, str(e), {}
+    finally:
+        done.set()
+        renewer.join()
+    return success, message, data
+
+
+def _flag_interrupted(entry: RewardOutbox, history: History):
+    """The entry was claimed before and its lease expired: the reward may already be applied.
+    Mark it failed without refunding, for an admin to check on Intra."""
+    message = "Reward interrupted while being applied, check on Intra before refunding the spin"
+    with transaction.atomic():
+        History.objects.filter(pk=history.pk).update(
+            r_message=message,
+            r_data={'error_kind': 'Interrupted', 'attempts': entry.attempts, 'last_error': entry.last_error},
+            success=False,
+            is_pending=False,
+        )
+        _uncount(history)
+        entry.delete()
+    logger.error(f"Reward needs review: {history.user.login} - {history.wheel} - {history.details} - {message}")
+
+
+def process_entry(entry: RewardOutbox) -> bool:
+    """Apply one reward and record the result on its History entry. Returns True on success."""
+    history = History.objects.select_related('user').get(pk=entry.history_id)
+    entry.history = history
+
+    if entry.attempts > MAX_ATTEMPTS:
+        _flag_interrupted(entry, history)
+        return False
+
+    success, message, data = _apply_reward(entry, history)
+
+    if not success and _should_defer(history, data):
+        entry.attempts -= 1
+        entry.last_error = str(message)
+        retry_in = timedelta(seconds=data.get('retry_in') or 0)
+        entry.next_attempt_at = timezone.now() + max(DEFER_DELAY, retry_in)
+        entry.save(update_fields=['attempts', 'last_error', 'next_attempt_at'])
+        logger.warning(f"Reward deferred ({data['error_kind']}): {history.user.login} - {history.wheel} - {history.details}")
+        return False
+
+    with transaction.atomic():
+        History.objects.filter(pk=history.pk).update(
+            r_message=message,
+            r_data=data,
+            success=success,
+            is_pending=False,
+        )
+        if not success:
+            _refund(entry)
+            _uncount(history)
+        entry.delete()
+
+    if not success:
+        logger.error(f"Reward failed, spin refunded: {history.user.login} - {history.wheel} - {history.details} - {message}")
+    return success
+
+
+def _process_in_thread(entry: RewardOutbox):
+    try:
+        return process_entry(entry)
+    except Exception as e:
+        logger.error("Reward worker failed on outbox entry %s: %s", entry.pk, e)
+        return False
+    finally:
+        close_old_connections()
+
+
+def drain_outbox(batch_size: int = 20, executor: ThreadPoolExecutor = None) -> int:
+    """Process one batch of due rewards. Returns the number of entries processed."""
+    entries = claim_batch(batch_size)
+    if not entries:
+        return 0
+    if executor is None:
+        for entry in entries:
+            _process_in_thread(entry)
+    else:
+        list(executor.map(_process_in_thread, entries))
+    return len(entries)
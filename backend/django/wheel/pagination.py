@@ -0,0 +1,78 @@
+import base64, json
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Keyset pagination of History querysets (newest first, on (timestamp, id))
+#
+# A page starts right after / before the (timestamp, id) of the last / first
+# row of the current page (opaque cursor), so its cost does not depend on how
+# deep it is, and no COUNT(*) is needed to know if there is a next page.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+def encode_cursor(timestamp, entry_id) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{entry_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """(timestamp, id) encoded in a cursor, or None if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, entry_id = raw.split('|')
+        timestamp = datetime.fromisoformat(timestamp)
+        if timezone.is_naive(timestamp):
+            return None
+        return timestamp, int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def older_than(qs, position):
+    """Rows strictly after position in the newest-first order: (timestamp, id) < position.
+    The timestamp bound is kept as a plain inequality so it is used as an index range."""
+    timestamp, entry_id = position
+    return qs.filter(timestamp__lte=timestamp).filter(Q(timestamp__lt=timestamp) | Q(id__lt=entry_id))
+
+
+def newer_than(qs, position):
+    """Rows strictly before position in the newest-first order: (timestamp, id) > position."""
+    timestamp, entry_id = position
+    return qs.filter(timestamp__gte=timestamp).filter(Q(timestamp__gt=timestamp) | Q(id__gt=entry_id))
+
+
+def keyset_page(qs, after=None, before=None, limit: int = 50) -> tuple[list, bool, bool]:
+    """
+    One page of qs, newest first: the rows following cursor position `after`, or the
+    rows preceding `before` (previous page), or the first page.
+    Returns (rows, has_previous, has_next).
+    """
+    if before is not None:
+        rows = list(newer_than(qs, before).order_by('timestamp', 'id')[:limit + 1])
+        has_previous = len(rows) > limit
+        return list(reversed(rows[:limit])), has_previous, True
+
+    if after is not None:
+        qs = older_than(qs, after)
+    rows = list(qs.order_by('-timestamp', '-id')[:limit + 1])
+    return rows[:limit], after is not None, len(rows) > limit
+
+
+def estimated_count(qs) -> int:
+    """
+    Number of rows of qs, as estimated by the PostgreSQL planner (EXPLAIN, the query is not run):
+    constant time on any table size, but approximate. Exact COUNT(*) on other backends.
+    """
+    qs = qs.order_by().values('pk')
+    if connection.vendor != 'postgresql':
+        return qs.count()
+    sql, params = qs.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,96 @@
+import os, threading, time
+
+from django.conf import settings
+
+from ft_wheel.utils import is_wheel_config_file, load_wheel_file, build_wheel_versions
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Wheel registry
+#
+# Every worker process serves wheels from here instead of a module global.
+# Changes are detected from the config files themselves (mtime + size), so an
+# edit made through one worker is picked up by all the others within
+# CHECK_INTERVAL, and only the changed files are parsed/compiled again.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Seconds between two checks of the configs directory
+CHECK_INTERVAL = 1.0
+
+
+class WheelSnapshot:
+    """Wheels and their version IDs at one point in time. Never mutated: read both from the same snapshot."""
+    __slots__ = ('wheels', 'versions')
+
+    def __init__(self, wheels: dict, versions: dict):
+        self.wheels = wheels
+        self.versions = versions
+
+
+class WheelRegistry:
+    def __init__(self, configs_dir: str = None):
+        self._configs_dir = configs_dir
+        self._lock = threading.Lock()
+        # fname -> ((mtime_ns, size), CompiledWheel or None)
+        self._files = {}
+        self._snapshot = WheelSnapshot({}, {})
+        self._checked_at = None
+
+    @property
+    def configs_dir(self) -> str:
+        return self._configs_dir or settings.WHEEL_CONFIGS_DIR
+
+    def snapshot(self) -> WheelSnapshot:
+        """Current snapshot, checking the configs directory at most every CHECK_INTERVAL."""
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at >= CHECK_INTERVAL:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self) -> WheelSnapshot:
+        """Reload changed/new config files, drop removed ones. Call after writing a config file."""
+        with self._lock:
+            stats = self._scan()
+            changed = stats.keys() != self._files.keys()
+            files = {}
+            for fname, stat in stats.items():
+                known = self._files.get(fname)
+                if known and known[0] == stat:
+                    files[fname] = known
+                    continue
+                changed = True
+                files[fname] = (stat, load_wheel_file(os.path.join(self.configs_dir, fname)))
+            if changed:
+                self._files = files
+                wheels = {}
+                # Same order in every process (if two files share a slug, the last one wins)
+                for fname in sorted(files):
+                    wheel = files[fname][1]
+                    if wheel is not None:
+                        wheels[wheel.slug] = wheel
+                self._snapshot = WheelSnapshot(wheels, build_wheel_versions(wheels))
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _scan(self) -> dict:
+        stats = {}
+        try:
+            with os.scandir(self.configs_dir) as entries:
+                for entry in entries:
+                    if not is_wheel_config_file(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    stats[entry.name] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+        return stats
+
+
+wheel_registry = WheelRegistry()
+
+
+def get_wheels() -> dict:
+    """{slug: CompiledWheel} of the current snapshot."""
+    return wheel_registry.snapshot().wheels
@@ -0,0 +1,106 @@
+import logging
+
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
+
+from users.models import Account
+
+logger = logging.getLogger('backend')
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# History search (administration history view)
+#
+# - login: prefix match, resolved to user ids first (users_account login index)
+#   so the History side is a plain user_id IN (...) index lookup;
+# - details: substring match, served on PostgreSQL by a pg_trgm GIN index on
+#   UPPER(details), the expression Django's icontains compares;
+# - r_message / r_data (full request dumps, unindexed): only when asked for.
+# Results can be ranked: exact login, login prefix, then details similarity.
+#
+# The extension and the index are created after migrate (install_search_indexes),
+# CONCURRENTLY: History is never locked for writes while it is built. Without
+# PostgreSQL or pg_trgm, search falls back to unindexed LIKE.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Users matched by a login prefix (more: the prefix is too short to be useful)
+MAX_LOGIN_MATCHES = 200
+
+SEARCH_INDEXES = {
+    'history_details_trgm_idx': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS history_details_trgm_idx '
+                                'ON wheel_history USING gin (UPPER(details) gin_trgm_ops)',
+}
+
+# Database alias -> whether pg_trgm is installed (checked once per process)
+_trigram = {}
+
+
+def install_search_indexes(using='default', **kwargs):
+    """post_migrate: pg_trgm and the search indexes (PostgreSQL only, idempotent)."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as e:
+            logger.warning(f"History search: pg_trgm unavailable ({e}), searches won't be indexed")
+            return
+        for name, sql in SEARCH_INDEXES.items():
+            # Left INVALID by an interrupted concurrent build: IF NOT EXISTS would keep it
+            cursor.execute(
+                "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+                [name],
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cursor.execute(sql)
+    _trigram.pop(using, None)
+
+
+def has_trigram(using='default') -> bool:
+    if using not in _trigram:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                available = cursor.fetchone() is not None
+        _trigram[using] = available
+    return _trigram[using]
+
+
+def _login_matches(query: str) -> tuple[list, list]:
+    """(ids of the users whose login is query, ids of those whose login starts with it)"""
+    rows = list(Account.objects.filter(login__startswith=query.lower()).values_list('id', 'login')[:MAX_LOGIN_MATCHES])
+    return [i for i, login in rows if login == query.lower()], [i for i, _ in rows]
+
+
+def search_history(qs, query: str, payloads: bool = False, ranked: bool = False):
+    """
+    History entries of qs matching query: login prefix or details substring, and with payloads the
+    reward message / data too. ranked: annotate a 'rank' (higher is better) to order the results by.
+    """
+    exact_ids, prefix_ids = _login_matches(query)
+    condition = Q(user_id__in=prefix_ids) | Q(details__icontains=query)
+    if payloads:
+        condition |= Q(r_message__icontains=query) | Q(r_data__icontains=query)
+    qs = qs.filter(condition)
+    if not ranked:
+        return qs
+
+    if has_trigram(qs.db):
+        from django.contrib.postgres.search import TrigramSimilarity
+        details_rank = TrigramSimilarity(Upper('details'), query.upper())
+    else:
+        details_rank = Case(When(details__iexact=query, then=Value(0.5)), default=Value(0.0), output_field=FloatField())
+    return qs.annotate(rank=Greatest(
+        Case(
+            When(user_id__in=exact_ids, then=Value(2.0)),
+            When(user_id__in=prefix_ids, then=Value(1.0)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        details_rank,
+    ))
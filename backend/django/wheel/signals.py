@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Ticket, TicketBalance, History, DailyWheelStat, UserSpinTotal
+
+
+# Keep TicketBalance in sync when tickets are granted or deleted, from anywhere
+# (control panel, ticket reward, Django admin, wheel deletion, cascades).
+# Consuming/restoring a ticket is an UPDATE: see TicketManager.consume/restore.
+
+@receiver(post_save, sender=Ticket)
+def ticket_granted(sender, instance, created, **kwargs):
+    if created and instance.used_at is None:
+        TicketBalance.objects.adjust(instance.user_id, instance.wheel_slug, 1)
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_deleted(sender, instance, **kwargs):
+    if instance.used_at is None:
+        TicketBalance.objects.adjust(instance.user_id, instance.wheel_slug, -1)
+
+
+# Keep the stats rollups in sync with History: the spin's insert (same
+# transaction as the spin, see wheel/outbox.py::enqueue_reward) and deletions
+# (user deletion cascades). Only History.counts_in_stats entries are counted:
+# a failed reward is taken back out by the reward worker (wheel/outbox.py),
+# cancellations are counted by cancel_history_entry.
+
+@receiver(post_save, sender=History)
+def history_created(sender, instance, created, **kwargs):
+    if created and instance.counts_in_stats:
+        DailyWheelStat.objects.record(instance, spins=1, cancelled=1 if instance.is_cancelled else 0)
+        UserSpinTotal.objects.adjust(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=History)
+def history_deleted(sender, instance, **kwargs):
+    if not instance.counts_in_stats:
+        return
+    DailyWheelStat.objects.record(instance, spins=-1, cancelled=-1 if instance.is_cancelled else 0)
+    UserSpinTotal.objects.adjust(instance.user_id, -1)
@@ -13,4 +13,5 @@ urlpatterns = [
     path('faq/', views.faq_view, name='faq'),
     path('api/patch-notes/', views.patch_notes_api, name='patch_notes_api'),
     path('api/current-wheel-config/', views.current_wheel_config_api, name='current_wheel_config_api'),
+    path('api/history/', views.history_api, name='history_api'),
 ]
\ No newline at end of file
@@ -7,17 +7,17 @@ from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbid
 from django.utils import timezone
 from django.conf import settings
 from django.views.decorators.http import require_GET, require_POST
-from django.db import transaction
-from django.db.models import Count
+from django.db import transaction, close_old_connections
+from django.db.models import F, Sum
 from datetime import timedelta
-import secrets, logging, json, os, ast
+import logging, json, os
+from asgiref.sync import sync_to_async
 
-from users.models import Account
-
-from .models import History
-from administration.models import SiteSettings
-from ft_wheel.utils import load_wheels, build_wheel_versions
-from api.jackpots_handler import handle_jackpots
+from .models import History, DailyWheelStat, UserSpinTotal
+from administration.site_settings import get_site_settings
+from .outbox import enqueue_reward
+from .registry import wheel_registry, get_wheels
+from .pagination import encode_cursor, decode_cursor, older_than
 
 logger = logging.getLogger('backend')
 
@@ -26,7 +26,8 @@ logger = logging.getLogger('backend')
 def wheel_view(request):
     # Slug from url
     slug = request.GET.get('wheel') or request.GET.get('mode')
-    wheels_store = getattr(settings, 'WHEEL_CONFIGS', {})
+    snapshot = wheel_registry.snapshot()
+    wheels_store = snapshot.wheels
     if slug and slug in wheels_store:
         request.session['wheel_config_type'] = slug
 
@@ -37,21 +38,18 @@ def wheel_view(request):
             request.session['wheel_config_type'] = first
 
     config_type = request.session.get('wheel_config_type')
-    meta = wheels_store.get(config_type, {})
-    sectors = meta.get('sectors', [])
-    ticket_only = bool(meta.get('ticket_only', False))
+    wheel = wheels_store.get(config_type)
+    # Only "label", "color", "message" of each distinct sector are sent to client,
+    # with the (sector index, weight) layout used to draw the wheel (precomputed at load time)
+    sectors = wheel.client_sectors if wheel else []
+    layout = wheel.client_layout if wheel else []
+    ticket_only = wheel.ticket_only if wheel else False
     # Compute (or fetch) version id
-    version_ids = getattr(settings, 'WHEEL_VERSION_IDS', {})
-    version_id = version_ids.get(config_type)
-
-    # Send only "label", "color", "message" to client
-    sectors = [{k: v for k, v in sector.items() if k in ('label', 'color', 'message')} for sector in sectors]
+    version_id = snapshot.versions.get(config_type)
 
-    request.session['current_wheel_sectors'] = sectors
     # Pass Python list (template uses json_script)
     try:
-        site_settings, _ = SiteSettings.objects.get_or_create(pk=1)
-        announcement_message = site_settings.announcement_message
+        announcement_message = get_site_settings().announcement_message
     except Exception:
         announcement_message = "Welcome on ft_wheel, have fun !"
 
@@ -65,6 +63,7 @@ def wheel_view(request):
 
     return render(request, 'wheel/wheel.html', {
         "jackpots": sectors,
+        "jackpots_layout": layout,
         "wheel_slug": config_type,
         'wheel_version_id': version_id,
         'wheel_ticket_only': ticket_only,
@@ -73,18 +72,59 @@ def wheel_view(request):
     })
 
 
+def _record_spin(user, config_type: str, wheel):
+    """Claim the spin (cooldown or ticket), draw the result and enqueue its reward in one transaction.
+    Returns (result, sector), or (error_response, None) if the spin is refused.
+    Sync: transactions are not available in the async ORM.
+    """
+    with transaction.atomic():
+        # Consume ticket if needed, else claim the cooldown
+        # In test_mode, bypass both ticket consumption and cooldown updates
+        consumed_ticket = None
+        claimed_spin_at = None
+        if not user.test_mode:
+            if wheel.ticket_only:
+                consumed_ticket = user.consume_ticket(config_type)
+                if not consumed_ticket:
+                    return JsonResponse({'error': 'no_ticket_available'}, status=403), None
+            else:
+                # Single conditional UPDATE: users still on cooldown are refused without a row lock
+                claimed_spin_at = timezone.now()
+                if not user.claim_spin(claimed_spin_at):
+                    return HttpResponseForbidden(), None
+
+        # YES IT IS RANDOM (weighted by segment, see CompiledWheel.draw)
+        result = wheel.draw()
+        sector = wheel.sector_at(result)
+        # # # # # # # # # # # # # # # # 
+
+        # The reward itself is applied by the reward worker (see wheel/outbox.py):
+        # the claim is committed as soon as the spin is recorded.
+        enqueue_reward(user, config_type, sector, consumed_ticket=consumed_ticket, claimed_spin_at=claimed_spin_at)
+    return result, sector
+
+
+def _record_spin_in_thread(user, config_type: str, wheel):
+    """_record_spin outside the request thread: its connection is released here (request_finished does not see it)."""
+    try:
+        return _record_spin(user, config_type, wheel)
+    finally:
+        close_old_connections()
+
+
 @login_required
 @require_http_methods(["POST"])
-def spin_view(request):
+async def spin_view(request):
+    """Async under daphne: requests refused by the async gate (cooldown, no ticket) never leave
+    the event loop; only _record_spin (one short transaction) runs in a worker thread."""
     # Determine wheel and its mode
 
-    config_type = request.session.get('wheel_config_type', 'standard')
-    cfg = settings.WHEEL_CONFIGS.get(config_type, {})
-    sectors = cfg.get('sectors', [])
-    ticket_only = bool(cfg.get('ticket_only', False))
+    config_type = await request.session.aget('wheel_config_type', 'standard')
+    snapshot = wheel_registry.snapshot()
+    wheel = snapshot.wheels.get(config_type)
 
     # If config not in sectors, reject like outdated version (this error should happen only if a wheel was deleted/renamed or a user beeing naughty)
-    if not sectors:
+    if not wheel or not wheel.total_weight:
         return JsonResponse({'error': 'outdated_wheel', 'expected_version': "unknown"}, status=409)
     # Client provided version id? ensure still current.
     try:
@@ -92,71 +132,36 @@ def spin_view(request):
     except Exception:
         body = {}
     client_version = body.get('wheel_version_id')
-    current_version = getattr(settings, 'WHEEL_VERSION_IDS', {}).get(config_type)
+    current_version = snapshot.versions.get(config_type)
     if not client_version:
         return JsonResponse({'error': 'missing_wheel_version_id', 'expected_version': current_version}, status=409)
     if current_version and client_version != current_version:
         return JsonResponse({'error': 'outdated_wheel', 'expected_version': current_version if current_version else "unknown"}, status=409)
 
-    with transaction.atomic():
-        # Consume ticket if needed, else set cooldown timestamp
-        # In test_mode, bypass both ticket consumption and cooldown updates
-        user = (
-            Account.objects.select_for_update().get(pk=request.user.pk)
-        )
-
-        if not user.can_spin_wheel(config_type, ticket_only):
-            return HttpResponseForbidden()
-        
-        if not user.test_mode:
-            if ticket_only:
-                if not user.consume_ticket(config_type):
-                    return JsonResponse({'error': 'no_ticket_available'}, status=403)
-            else:
-                user.last_spin = timezone.now()
-                user.save(update_fields=["last_spin"])
+    # Cheap gate with the async ORM first (last_spin of the request user, ticket balance row).
+    # The claim in _record_spin stays the authority for concurrent spins.
+    user = await request.auser()
+    if not await user.acan_spin_wheel(config_type, wheel.ticket_only):
+        if wheel.ticket_only:
+            return JsonResponse({'error': 'no_ticket_available'}, status=403)
+        return HttpResponseForbidden()
 
-        # YES IT IS RANDOM
-        result = secrets.randbelow(len(sectors))
-        # # # # # # # # # # # # # # # # 
+    try:
+        # Self-contained transaction: no need to share Django's single sync thread with other requests
+        result, sector = await sync_to_async(_record_spin_in_thread, thread_sensitive=False)(user, config_type, wheel)
+    except Exception as e:
+        # Transaction rolled back, undoing ticket/cooldown consumption
+        logger.error("Unexpected error while recording spin: %s", e)
+        return JsonResponse({'error': 'server_error', 'message': 'An error occurred while processing your spin. Please contact an admin.'}, status=500)
+    if sector is None:
+        # Refused by the claim (on cooldown or no ticket left)
+        return result
 
-        try:
-            success, message, data = handle_jackpots(user, sectors[result])
-                
-            details=sectors[result]['label']
-
-            if type(data) is ValueError:
-                data = data.args[0]
-            elif type(data) is str:
-                data = ast.literal_eval(data)
-            elif type(data) is not dict:
-                raise ValueError("Unexpected data type from jackpot handler: %s" % type(data))
-
-            History.objects.create(
-                wheel=config_type,
-                details=details,
-                color=sectors[result]['color'],
-                function_name=sectors[result]['function'],
-                r_message=message,
-                r_data=data,
-                success=success,
-                user=user
-            )
-            if not success:
-                # Transaction will rollback, undoing ticket/cooldown consumption
-                return JsonResponse({'error': 'server_error', 'message': 'An error occurred while processing your spin. Please contact an admin.'}, status=500)
-        except Exception as e:
-            # Transaction will rollback, undoing ticket/cooldown consumption
-            logger.error("Unexpected error while saving history or handling jackpots: %s", e)
-            return JsonResponse({'error': 'server_error', 'message': 'An error occurred while processing your spin. Please contact an admin.'}, status=500)
-        
-    logger.info(f"Jackpots! {user.login} - {config_type} - {sectors[result]}")
+    logger.info(f"Jackpots! {user.login} - {config_type} - {sector.as_dict()}")
 
-    sector = sectors[result]
     # Send only "label", "color" and "message" to client
-    sector = {k: v for k, v in sector.items() if k in ('label', 'color', 'message')}
-
-    return JsonResponse({'result': result, 'sector': sector, 'wheel_version_id': current_version})
+    # result is the segment index in the wheel layout
+    return JsonResponse({'result': result, 'sector': sector.client_payload(), 'wheel_version_id': current_version})
 
 
 @login_required
@@ -171,13 +176,13 @@ def change_wheel_config(request):
     try:
         data = json.loads(request.body)
         mode = data.get('mode')
-        if mode not in settings.WHEEL_CONFIGS:
+        wheel = get_wheels().get(mode)
+        if wheel is None:
             return JsonResponse({'error': 'Configuration not available'}, status=400)
         
-        sectors = settings.WHEEL_CONFIGS[mode]['sectors']
         request.session['wheel_config_type'] = mode
         
-        return JsonResponse({'sectors': sectors})
+        return JsonResponse({'sectors': wheel.client_sectors, 'layout': wheel.client_layout})
     except Exception as e:
         logger.error(f"Error while changing wheel configuration: {e}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -186,38 +191,87 @@ def change_wheel_config(request):
 @login_required
 @require_http_methods(["GET"])
 def history_view(request):
-    # Get all history entries from any users (maximum of 100 entries)
-    all_history = History.objects.all().only('id', 'timestamp', 'wheel', 'details', 'color', 'user__login').order_by('-timestamp')[:100]
-    my_history = History.objects.filter(user=request.user).only('id', 'timestamp', 'wheel', 'details', 'color').order_by('-timestamp')[:100]
+    # Entries are loaded page by page by the page itself (see history_api)
+    return render(request, 'wheel/history.html')
+
 
-    return render(request, 'wheel/history.html', {'all_history': all_history, 'my_history': my_history})
+# History feeds page size (default, maximum)
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+@login_required
+@require_http_methods(["GET"])
+def history_api(request):
+    """History feed for infinite scroll: ?scope=all|mine&cursor=<next of the previous page>&limit=<n>
+    Keyset pagination on (timestamp, id), newest first: each page is a range scan of
+    history_feed_idx / history_user_feed_idx, however deep the page, that fetches only
+    the page's rows (and their users' login for scope=all).
+    """
+    scope = request.GET.get('scope', 'all')
+    if scope not in ('all', 'mine'):
+        return JsonResponse({'error': 'invalid_scope'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'invalid_limit'}, status=400)
+
+    qs = History.objects.all()
+    fields = ['id', 'timestamp', 'wheel', 'details', 'color']
+    if scope == 'mine':
+        qs = qs.filter(user=request.user)
+    else:
+        fields.append('user__login')
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return JsonResponse({'error': 'invalid_cursor'}, status=400)
+        qs = older_than(qs, position)
+
+    rows = list(qs.order_by('-timestamp', '-id').values_list(*fields)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    entries = []
+    for row in rows:
+        entry = {'id': row[0], 'ts': row[1].isoformat(), 'wheel': row[2], 'details': row[3], 'color': row[4]}
+        if scope == 'all':
+            entry['login'] = row[5]
+        entries.append(entry)
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None
+    return JsonResponse({'entries': entries, 'next': next_cursor})
 
 
 @login_required
 @require_http_methods(["GET"])
 def stats_view(request):
-    # Aggregate global statistics from the History audit log.
+    # Global statistics, read from the rollup tables kept in sync with History
+    # (DailyWheelStat, UserSpinTotal: see wheel/signals.py).
     # Cancelled entries are kept in "spins" (the spin happened) but excluded
     # from the reward distribution (the reward was reverted by an admin).
-    qs = History.objects.all()
+    # Spins whose reward failed were refunded and are not counted at all.
+    daily = DailyWheelStat.objects.all()
 
-    total_spins = qs.count()
-    unique_players = qs.values('user').distinct().count()
-    spins_last_7d = qs.filter(timestamp__gte=timezone.now() - timedelta(days=7)).count()
+    total_spins = daily.aggregate(total=Sum('spins'))['total'] or 0
+    unique_players = UserSpinTotal.objects.filter(spins__gt=0).count()
+    # Last 7 days, today included (UTC days)
+    spins_last_7d = daily.filter(day__gt=timezone.localdate() - timedelta(days=7)).aggregate(total=Sum('spins'))['total'] or 0
 
     leaderboard = list(
-        qs.values('user__login')
-          .annotate(spins=Count('id'))
+        UserSpinTotal.objects.filter(spins__gt=0)
+          .values('user__login', 'spins')
           .order_by('-spins', 'user__login')[:10]
     )
     for rank, row in enumerate(leaderboard, start=1):
         row['rank'] = rank
 
     reward_distribution = list(
-        qs.filter(is_cancelled=False)
-          .exclude(details__isnull=True)
+        daily.exclude(details='')
           .values('details', 'color')
-          .annotate(count=Count('id'))
+          .annotate(count=Sum(F('spins') - F('cancelled')))
+          .filter(count__gt=0)
           .order_by('-count')[:8]
     )
     max_reward = reward_distribution[0]['count'] if reward_distribution else 0
@@ -262,7 +316,7 @@ def patch_notes_api(request):
 def current_wheel_config_api(request):
     """API endpoint to get current wheel configuration"""
     current_mode = request.session.get('wheel_config_type', 'standard')
-    wheels_store = load_wheels(settings.WHEEL_CONFIGS_DIR)
+    wheels_store = get_wheels()
     
     # Check if current mode still exists
     if current_mode not in wheels_store:
@@ -277,7 +331,7 @@ def current_wheel_config_api(request):
     return JsonResponse({
         'current_mode': current_mode,
         'available_modes': [
-            {'slug': slug, 'ticket_only': bool(meta.get('ticket_only', False))}
-            for slug, meta in wheels_store.items()
+            {'slug': slug, 'ticket_only': wheel.ticket_only}
+            for slug, wheel in wheels_store.items()
         ]
     })
@@ -10,8 +10,17 @@ python3 django/manage.py migrate
 echo ""
 python3 django/create_superusers.py
 echo ""
+# Ticket balances are derived from the tickets table (see wheel/models.py)
+python3 django/manage.py sync_ticket_balances
+echo ""
+# /stats/ rollups are kept in sync with the history, built once from it (see wheel/models.py)
+python3 django/manage.py rebuild_stats --if-empty
+echo ""
 
 
 export PYTHONPATH="/backend/django"
 
+# Applies spin rewards to the Intra API in the background (see wheel/outbox.py)
+python3 django/manage.py reward_worker &
+
 daphne -b 0.0.0.0 -p 8000 ft_wheel.asgi:application
\ No newline at end of file